@@ -8,13 +8,58 @@ Description: Defines the environment
 import numpy as np
 import pygame, sys, time, math, random
 from pygame.locals import *
+from GeometryBuffer import GeometryBuffer
+from SpatialIndex import SpatialIndex, expandRanges, outsidePlanes
+from FrameStats import FrameStats
+from Projection import transformVisible, projectView
+from ParallelRenderer import ParallelRenderer
+from SceneFile import writeArrays, readArrays
+from Rasterizer import RASTERIZERS, POINTRADIUS
+from ProceduralFractal import ChunkCache, CubeFractal, RandomFractal, PROCEDURALKINDS
 
 class Environment:   
     
-    def __init__(self,w=100,speedScalar=1):
-        self.points = np.array([]) #Stores all n points as an nx4 matrix
-        self.rawPointsReference = np.array([]) #Saves the index of each raw point
-        self.linePointsReference = np.array([]) #Saves the first index of each line pair
+    CUBECORNERS = np.array([[1,1,1],[-1,1,1],[1,-1,1],[1,1,-1],[-1,-1,1],[-1,-1,-1],[-1,1,-1],[1,-1,-1]]) #Corner signs of a cube
+    CUBEEDGES = np.array([[0,1],[0,2],[0,3],[4,2],[4,1],[4,5],[6,3],[6,5],[6,1],[3,7],[5,7],[2,7]]) #Corner indexes of the 12 edges of a cube
+    BACKGROUNDCOLOR = (241,241,241)
+    LINECOLOR = (168,0,0)
+    STEPSPERSECOND = 60 #Camera steps per second a key is held, each moving 10*speedScalar or turning 3*speedScalar degrees
+    MAXCATCHUPTICKS = 5 #Most ticks run between two frames; elapsed time beyond this is dropped instead of replayed
+    MAXDIRTYRECTS = 16 #Most rectangles redrawn separately in one frame; more are merged into their union
+    
+    def __init__(self,w=100,speedScalar=1,precision='float64',rasterizer='pygame',lodPixels=0):
+        ##precision 'float32' halves the geometry memory: vertices are stored as float32 x,y,z with the homogeneous
+        ##w = 1 left implicit, and indexes as int32 (so at most 2^31 vertices). Vertices are widened to float64 when
+        ##transformed, so only their storage is rounded. rasterizer picks how projected geometry is drawn: 'pygame' with
+        ##one call per primitive, 'polyline' joining connected lines into pygame.draw.lines calls, or 'numpy' writing
+        ##the pixels directly (see Rasterizer.py). All three draw the same pixels. With lodPixels > 0, any branch of a
+        ##createRandomFractal or createCubeFractal tree projecting smaller than that many pixels is drawn as one point
+        if precision not in ('float64','float32'):
+            raise ValueError("precision must be 'float64' or 'float32', not %r" % (precision,))
+        if rasterizer not in RASTERIZERS:
+            raise ValueError('rasterizer must be one of %s, not %r' % (', '.join(map(repr,RASTERIZERS)),rasterizer))
+        if precision == 'float32':
+            self.vertexBuffer = GeometryBuffer(3,'float32') #Stores all n distinct vertices as an nx3 matrix in world space
+            indexType = 'int32'
+        else:
+            self.vertexBuffer = GeometryBuffer(4,'float64') #Stores all n distinct vertices as an nx4 matrix in world space, never moved by the camera
+            indexType = 'int64'
+        self.pointBuffer = GeometryBuffer(None,indexType) #Saves the vertex index of each raw point
+        self.lineBuffer = GeometryBuffer(2,indexType) #Saves the pair of vertex indexes of each line
+        self.vertexObjectBuffer = GeometryBuffer(None,indexType) #Saves the id of the object each vertex belongs to
+        self.objectParentBuffer = GeometryBuffer(None,indexType) #Saves the id of the object each fractal object was generated from, -1 for others
+        self.pointAliveBuffer = GeometryBuffer(None,'bool') #False marks a deleted point until the buffers are compacted
+        self.lineAliveBuffer = GeometryBuffer(None,'bool') #False marks a deleted line until the buffers are compacted
+        self.deadPoints = 0
+        self.deadLines = 0
+        self.pointKeys = None #Maps x,y,z of each point to its rows, built on the first delete by coordinates
+        self.lineKeys = None #Maps x1,y1,z1,x2,y2,z2 of each line to its rows, built on the first delete by coordinates
+        self.indexedPoints = 0 #Number of point rows already in pointKeys
+        self.indexedLines = 0 #Number of line rows already in lineKeys
+        self.objectCount = 0
+        self.sceneVersion = 0 #Incremented whenever geometry is created or deleted
+        self.spatialIndex = None #Hierarchy over object bounding boxes, rebuilt on the next frame after the scene changes
+        self.camera = np.identity(4) #View matrix taking world space points into the viewer's space
         self.w = w
         self.WINDOWWIDTH = 500
         self.WINDOWHEIGHT = 500
@@ -25,58 +70,190 @@ class Environment:
         self.isRotatingY = 0
         self.isRotatingZ = 0
         self.speedScalar = speedScalar
+        self.stats = None #FrameStats collecting per-frame timings and counts, None while profiling is disabled
+        self.statsOverlay = False
+        self.parallelRenderer = None #Worker pool rendering in parallel, None for the single process path
+        self.rasterizer = rasterizer #Key of RASTERIZERS drawing each frame
+        self.lodPixels = lodPixels #Screen size below which a fractal branch is collapsed into a point, 0 to draw every level
+        self.proceduralFractals = [] #Fractals stored as seeds and parameters, expanded as the camera needs them; None once deleted
+        self.chunkCache = ChunkCache() #Recently expanded procedural fractal chunks, bounded by chunkCache.maxBytes
+        self.drawnCamera = None #Camera of the frame on the window, None when the whole window must be redrawn
+        self.dirtyBounds = [] #World space boxes (kx6) of geometry created or deleted since the frame on the window
+        self.scratchSurface = None #Window sized surface that dirty rectangles are redrawn on
+        self.overlayRect = None #Window area covered by the last stats overlay
+
+    @property
+    def points(self):
+        return self.vertexBuffer.view()
+
+    @property
+    def rawPointsReference(self):
+        return self.pointBuffer.view()
+
+    @property
+    def linePointsReference(self):
+        return self.lineBuffer.view()
         
     def createPoint(self,x,y,z):
-        newPoint = np.array([x,y,z,1],dtype='float64')
-        if self.points.size == 0:
-            self.points = np.array([newPoint])
-        else:
-            self.points = np.vstack([self.points,newPoint])
-        self.rawPointsReference = np.append(self.rawPointsReference,self.points.shape[0]-1)            
+        return self.createPoints(np.array([[x,y,z]]))[0]
 
     def createLine(self,x1,y1,z1,x2,y2,z2):
-        newPoint1 = np.array([x1,y1,z1,1],dtype='float64')
-        newPoint2 = np.array([x2,y2,z2,1],dtype='float64')
-        if self.points.size == 0:
-            self.points = np.array([newPoint1])
-        else:
-            self.points = np.vstack([self.points,newPoint1])
-        self.points = np.vstack([self.points,newPoint2])
-        self.linePointsReference = np.append(self.linePointsReference,self.points.shape[0]-2)
+        return self.createLines(np.array([[x1,y1,z1,x2,y2,z2]]))[0]
+
+    def createVertices(self,vertices,vertexObjects=None):
+        ##Stores a kx3 array of x,y,z rows as vertices and returns the index of the first one. vertexObjects labels
+        ##which vertices form separately culled objects (all one object by default). A line belongs to the object of
+        ##its second vertex and a point to the object of its vertex
+        vertices = np.asarray(vertices,dtype='float64').reshape(-1,3)
+        if vertexObjects is None:
+            vertexObjects = np.zeros(vertices.shape[0],dtype='int64')
+        vertexObjects = np.unique(vertexObjects,return_inverse=True)[1].reshape(-1) #Number the new objects 0..k-1
+        self.vertexObjectBuffer.append(self.objectCount+vertexObjects)
+        numObjects = vertexObjects.max()+1 if vertexObjects.size else 0
+        self.objectParentBuffer.append(np.full(numObjects,-1))
+        self.objectCount += numObjects
+        self.spatialIndex = None
+        self.sceneVersion += 1
+        if self.vertexBuffer.width == 3: #Homogeneous w is implicit
+            return self.vertexBuffer.append(vertices)
+        return self.vertexBuffer.append(np.hstack([vertices,np.ones((vertices.shape[0],1))]))
+
+    def addPoints(self,pointIndexes):
+        ##Marks existing vertices as raw points
+        self.pointAliveBuffer.append(np.ones(np.size(pointIndexes),dtype='bool'))
+        self.sceneVersion += 1
+        self.markVerticesDirty(pointIndexes)
+        return self.pointBuffer.append(pointIndexes)
+
+    def addLines(self,edges):
+        ##Joins existing vertices with lines, edges being an mx2 array of vertex indexes
+        self.lineAliveBuffer.append(np.ones(np.size(edges)//2,dtype='bool'))
+        self.sceneVersion += 1
+        self.markVerticesDirty(edges)
+        return self.lineBuffer.append(edges)
+
+    def createMesh(self,vertices,edges=None,pointIndexes=None,vertexObjects=None):
+        ##Stores an indexed mesh: edges (mx2) and pointIndexes (k) index into the kx3 vertices array,
+        ##so a vertex shared by several lines is only stored, transformed and projected once.
+        ##Returns the ids of the new objects, which can be passed to deleteObjects
+        firstObject = self.objectCount
+        start = self.createVertices(vertices,vertexObjects)
+        if edges is not None:
+            self.addLines(start+np.asarray(edges,dtype='int64'))
+        if pointIndexes is not None:
+            self.addPoints(start+np.asarray(pointIndexes,dtype='int64'))
+        return np.arange(firstObject,self.objectCount)
+
+    def createPoints(self,points):
+        ##Bulk version of createPoint: points is a kx3 array of x,y,z rows. Returns one object id per point
+        points = np.asarray(points,dtype='float64').reshape(-1,3)
+        return self.createMesh(points,pointIndexes=np.arange(points.shape[0]),vertexObjects=np.arange(points.shape[0]))
+
+    def createLines(self,segments):
+        ##Bulk version of createLine: segments is an mx6 (or mx2x3) array of x1,y1,z1,x2,y2,z2 rows. Returns one object id per line
+        ends = np.asarray(segments,dtype='float64').reshape(-1,3)
+        return self.createMesh(ends,edges=np.arange(ends.shape[0]).reshape(-1,2),vertexObjects=np.arange(ends.shape[0])//2)
 
     def deleteLine(self,x1,y1,z1,x2,y2,z2):
-        for pointIndex in range(self.points.shape[0]-1):
-            if pointIndex in self.linePointsReference:
-                if self.comparePoints(np.array([x1,y1,z1]),self.points[pointIndex]) and self.comparePoints(np.array([x2,y2,z2]),self.points[pointIndex+1]):
-                    self.linePointsReference -= 2*(self.linePointsReference > pointIndex) #Decrement indexes by 2 for line points with indexes greater than the deleted index
-                    self.rawPointsReference -= 2*(self.rawPointsReference > pointIndex)
-                    self.points = np.delete(self.points,pointIndex)
-                    self.points = np.delete(self.points,pointIndex)
+        self.deleteLines(np.array([[x1,y1,z1,x2,y2,z2]]))
 
     def deletePoint(self,x,y,z):
-       for pointIndex in range(self.points.shape[0]):
-           if pointIndex in self.rawPointsReference:
-               if self.comparePoints(np.array([x,y,z]),self.points[pointIndex]):
-                    self.linePointsReference -= (self.linePointsReference > pointIndex) #Decrement indexes by 1 for line points with indexes greater than the deleted index
-                    self.rawPointsReference -= (self.rawPointsReference > pointIndex)
-                    self.points = np.delete(self.points,pointIndex)
+        self.deletePoints(np.array([[x,y,z]]))
+
+    def deleteLines(self,segments):
+        ##Removes every line whose endpoints match a row of the mx6 segments array, looked up by coordinates
+        if self.lineKeys is None:
+            self.lineKeys = {}
+        lines = self.linePointsReference[self.indexedLines:]
+        keys = np.hstack([self.points[lines[:,0],:3],self.points[lines[:,1],:3]]).tolist()
+        for row,key in enumerate(keys,self.indexedLines): #Index the lines created since the last lookup
+            self.lineKeys.setdefault(tuple(key),[]).append(row)
+        self.indexedLines = len(self.lineBuffer)
+        rows = [row for key in np.asarray(segments,dtype=self.points.dtype).reshape(-1,6).tolist() for row in self.lineKeys.get(tuple(key),[])]
+        self.removeLines(np.array(rows,dtype='int64'))
+
+    def deletePoints(self,points):
+        ##Removes every point matching a row of the kx3 points array, looked up by coordinates
+        if self.pointKeys is None:
+            self.pointKeys = {}
+        keys = self.points[self.rawPointsReference[self.indexedPoints:],:3].tolist()
+        for row,key in enumerate(keys,self.indexedPoints): #Index the points created since the last lookup
+            self.pointKeys.setdefault(tuple(key),[]).append(row)
+        self.indexedPoints = len(self.pointBuffer)
+        rows = [row for key in np.asarray(points,dtype=self.points.dtype).reshape(-1,3).tolist() for row in self.pointKeys.get(tuple(key),[])]
+        self.removePoints(np.array(rows,dtype='int64'))
+
+    def deleteObjects(self,objects):
+        ##Removes every line and point of the objects whose ids were returned by the create methods
+        vertexObjects = self.vertexObjectBuffer.view()
+        self.removeLines(np.flatnonzero(np.isin(vertexObjects[self.linePointsReference[:,1]],objects)))
+        self.removePoints(np.flatnonzero(np.isin(vertexObjects[self.rawPointsReference],objects)))
+
+    def removeLines(self,rows):
+        ##Tombstones line rows; the buffers are compacted once half of their rows are dead
+        lineAlive = self.lineAliveBuffer.view()
+        rows = np.unique(rows)
+        rows = rows[lineAlive[rows]]
+        lineAlive[rows] = False
+        self.deadLines += rows.size
+        self.sceneVersion += 1
+        if rows.size:
+            self.spatialIndex = None #Object boxes only cover live lines and points
+        self.markVerticesDirty(self.linePointsReference[rows])
+        if self.deadLines > len(self.lineBuffer)/2:
+            self.compact()
+
+    def removePoints(self,rows):
+        pointAlive = self.pointAliveBuffer.view()
+        rows = np.unique(rows)
+        rows = rows[pointAlive[rows]]
+        pointAlive[rows] = False
+        self.deadPoints += rows.size
+        self.sceneVersion += 1
+        if rows.size:
+            self.spatialIndex = None
+        self.markVerticesDirty(self.rawPointsReference[rows])
+        if self.deadPoints > len(self.pointBuffer)/2:
+            self.compact()
+
+    def compact(self):
+        ##Drops dead lines and points and the vertices no longer used by anything, renumbering the survivors
+        self.lineBuffer.compress(self.lineAliveBuffer.view())
+        self.pointBuffer.compress(self.pointAliveBuffer.view())
+        self.lineAliveBuffer.compress(self.lineAliveBuffer.view())
+        self.pointAliveBuffer.compress(self.pointAliveBuffer.view())
+        used = np.zeros(len(self.vertexBuffer),dtype='bool')
+        used[self.linePointsReference.ravel()] = True
+        used[self.rawPointsReference] = True
+        renumber = np.cumsum(used)-1
+        self.linePointsReference[:] = renumber[self.linePointsReference]
+        self.rawPointsReference[:] = renumber[self.rawPointsReference]
+        self.vertexBuffer.compress(used)
+        self.vertexObjectBuffer.compress(used)
+        self.deadLines = 0
+        self.deadPoints = 0
+        self.lineKeys = None
+        self.pointKeys = None
+        self.indexedLines = 0
+        self.indexedPoints = 0
+        self.spatialIndex = None
+        self.sceneVersion += 1
 
     def createCube(self,centerX,centerY,centerZ,sideLength):
-        self.createLine(centerX+sideLength/2,centerY+sideLength/2,centerZ+sideLength/2,centerX-sideLength/2,centerY+sideLength/2,centerZ+sideLength/2)
-        self.createLine(centerX+sideLength/2,centerY+sideLength/2,centerZ+sideLength/2,centerX+sideLength/2,centerY-sideLength/2,centerZ+sideLength/2)
-        self.createLine(centerX+sideLength/2,centerY+sideLength/2,centerZ+sideLength/2,centerX+sideLength/2,centerY+sideLength/2,centerZ-sideLength/2)
-        self.createLine(centerX-sideLength/2,centerY-sideLength/2,centerZ+sideLength/2,centerX+sideLength/2,centerY-sideLength/2,centerZ+sideLength/2)
-        self.createLine(centerX-sideLength/2,centerY-sideLength/2,centerZ+sideLength/2,centerX-sideLength/2,centerY+sideLength/2,centerZ+sideLength/2)
-        self.createLine(centerX-sideLength/2,centerY-sideLength/2,centerZ+sideLength/2,centerX-sideLength/2,centerY-sideLength/2,centerZ-sideLength/2)
-        self.createLine(centerX-sideLength/2,centerY+sideLength/2,centerZ-sideLength/2,centerX+sideLength/2,centerY+sideLength/2,centerZ-sideLength/2)
-        self.createLine(centerX-sideLength/2,centerY+sideLength/2,centerZ-sideLength/2,centerX-sideLength/2,centerY-sideLength/2,centerZ-sideLength/2)
-        self.createLine(centerX-sideLength/2,centerY+sideLength/2,centerZ-sideLength/2,centerX-sideLength/2,centerY+sideLength/2,centerZ+sideLength/2)
-        self.createLine(centerX+sideLength/2,centerY+sideLength/2,centerZ-sideLength/2,centerX+sideLength/2,centerY-sideLength/2,centerZ-sideLength/2)
-        self.createLine(centerX-sideLength/2,centerY-sideLength/2,centerZ-sideLength/2,centerX+sideLength/2,centerY-sideLength/2,centerZ-sideLength/2)
-        self.createLine(centerX+sideLength/2,centerY-sideLength/2,centerZ+sideLength/2,centerX+sideLength/2,centerY-sideLength/2,centerZ-sideLength/2)
+        return self.createCubes(np.array([[centerX,centerY,centerZ]]),np.array([sideLength]))[0]
+
+    def createCubes(self,centers,sideLengths):
+        ##Bulk version of createCube: centers is a kx3 array, sideLengths a length k array.
+        ##Each cube stores its 8 corners once and 12 edges indexing them. Returns one object id per cube
+        centers = np.asarray(centers,dtype='float64').reshape(-1,1,3)
+        halfSides = np.asarray(sideLengths,dtype='float64').reshape(-1,1,1)/2
+        corners = centers+self.CUBECORNERS*halfSides
+        edges = self.CUBEEDGES+8*np.arange(corners.shape[0]).reshape(-1,1,1)
+        return self.createMesh(corners,edges=edges.reshape(-1,2),vertexObjects=np.arange(corners.shape[0]*8)//8)
 
 
     def createRandomPath(self,startX,startY,startZ,minTraverseDistance,maxTraverseDistance,numSegments):
+        path = [[startX,startY,startZ]] #Each segment starts at the previous segment's end vertex
         for segment in range(numSegments):
             traverseX = random.randint(-50,50)
             traverseY = random.randint(-50,50)
@@ -90,15 +267,23 @@ class Environment:
             traverseY *= traverseDistance/norm
             traverseZ *= traverseDistance/norm
             
-            self.createLine(startX,startY,startZ,startX+traverseX,startY+traverseY,startZ+traverseZ)
             startX += traverseX
             startY += traverseY
             startZ += traverseZ
+            path.append([startX,startY,startZ])
+        edges = np.transpose([np.arange(numSegments),np.arange(1,numSegments+1)])
+        return self.createMesh(np.array(path),edges=edges)[0]
 
-    def createRandomFractal(self,startX,startY,startZ,minTraverseDistance,maxTraverseDistance,maxLeaves,depth,decay=0.5):
+    def createRandomFractal(self,startX,startY,startZ,minTraverseDistance,maxTraverseDistance,maxLeaves,depth,decay=0.5,startIndex=None,parentObject=None):
+        ##startIndex is the vertex already holding the start position when recursing, so branch points are stored once,
+        ##and parentObject the object of the branch recursed from. Returns the ids of every object in the fractal
+        firstObject = self.objectCount
         numLeaves = random.randint(1,maxLeaves)
         savedLeaveEnds = np.array([])
-        self.createPoint(startX,startY,startZ)
+        if startIndex is None:
+            startIndex = self.createVertices(np.array([startX,startY,startZ]))
+            parentObject = firstObject #The start point is the root of the fractal's hierarchy
+        self.addPoints(startIndex)
         for i in range(numLeaves):
             traverseX = random.randint(-50,50)
             traverseY = random.randint(-50,50)
@@ -111,42 +296,96 @@ class Environment:
             traverseX *= traverseDistance/norm
             traverseY *= traverseDistance/norm
             traverseZ *= traverseDistance/norm
-            self.createLine(startX,startY,startZ,startX+traverseX,startY+traverseY,startZ+traverseZ)
             savedLeaveEnds = np.append(savedLeaveEnds,np.array([startX+traverseX,startY+traverseY,startZ+traverseZ]))
+        leafStart = self.createVertices(savedLeaveEnds)
+        leafObject = self.objectCount-1
+        if parentObject is not None:
+            self.objectParentBuffer.view()[leafObject] = parentObject
+        self.addLines(np.transpose([np.full(numLeaves,startIndex),leafStart+np.arange(numLeaves)]))
         if depth == 1:
-            return
+            return np.arange(firstObject,self.objectCount)
         else:
             for i in range(int(savedLeaveEnds.size/3)):
-                self.createRandomFractal(savedLeaveEnds[3*i],savedLeaveEnds[3*i+1],savedLeaveEnds[3*i+2],int(decay*minTraverseDistance),int(decay*maxTraverseDistance),maxLeaves,depth-1)
+                self.createRandomFractal(savedLeaveEnds[3*i],savedLeaveEnds[3*i+1],savedLeaveEnds[3*i+2],int(decay*minTraverseDistance),int(decay*maxTraverseDistance),maxLeaves,depth-1,startIndex=leafStart+i,parentObject=leafObject)
+            return np.arange(firstObject,self.objectCount)
 
-    def createCubeFractal(self,centerX,centerY,centerZ,maxSideLength,maxLeaves,depth,decay = 0.5):
+    def createCubeFractal(self,centerX,centerY,centerZ,maxSideLength,maxLeaves,depth,decay = 0.5,parentObject=None):
+        ##parentObject is the cube recursed from. Returns the ids of every cube in the fractal
+        firstObject = self.objectCount
         numLeaves = random.randint(1,maxLeaves)
         SL = int(random.random()*maxSideLength)
-        self.createCube(centerX,centerY,centerZ,SL)
+        cube = self.createCube(centerX,centerY,centerZ,SL)
+        if parentObject is not None:
+            self.objectParentBuffer.view()[cube] = parentObject
         if maxLeaves > 8:
             maxLeaves = 8
         choices = np.random.choice(8,maxLeaves)
         if depth == 0:
-            return
+            return np.arange(firstObject,self.objectCount)
         if 0 in choices:
-            self.createCubeFractal(centerX-SL/2,centerY-SL/2,centerZ-SL/2,decay*maxSideLength,maxLeaves,depth-1)
+            self.createCubeFractal(centerX-SL/2,centerY-SL/2,centerZ-SL/2,decay*maxSideLength,maxLeaves,depth-1,parentObject=cube)
         if 1 in choices:
-            self.createCubeFractal(centerX-SL/2,centerY-SL/2,centerZ+SL/2,decay*maxSideLength,maxLeaves,depth-1)
+            self.createCubeFractal(centerX-SL/2,centerY-SL/2,centerZ+SL/2,decay*maxSideLength,maxLeaves,depth-1,parentObject=cube)
         if 2 in choices:
-            self.createCubeFractal(centerX-SL/2,centerY+SL/2,centerZ-SL/2,decay*maxSideLength,maxLeaves,depth-1)
+            self.createCubeFractal(centerX-SL/2,centerY+SL/2,centerZ-SL/2,decay*maxSideLength,maxLeaves,depth-1,parentObject=cube)
         if 3 in choices:
-            self.createCubeFractal(centerX-SL/2,centerY+SL/2,centerZ+SL/2,decay*maxSideLength,maxLeaves,depth-1)
+            self.createCubeFractal(centerX-SL/2,centerY+SL/2,centerZ+SL/2,decay*maxSideLength,maxLeaves,depth-1,parentObject=cube)
         if 4 in choices:
-            self.createCubeFractal(centerX+SL/2,centerY-SL/2,centerZ-SL/2,decay*maxSideLength,maxLeaves,depth-1)
+            self.createCubeFractal(centerX+SL/2,centerY-SL/2,centerZ-SL/2,decay*maxSideLength,maxLeaves,depth-1,parentObject=cube)
         if 5 in choices:
-            self.createCubeFractal(centerX+SL/2,centerY-SL/2,centerZ+SL/2,decay*maxSideLength,maxLeaves,depth-1)
+            self.createCubeFractal(centerX+SL/2,centerY-SL/2,centerZ+SL/2,decay*maxSideLength,maxLeaves,depth-1,parentObject=cube)
         if 6 in choices:
-            self.createCubeFractal(centerX+SL/2,centerY+SL/2,centerZ-SL/2,decay*maxSideLength,maxLeaves,depth-1)
+            self.createCubeFractal(centerX+SL/2,centerY+SL/2,centerZ-SL/2,decay*maxSideLength,maxLeaves,depth-1,parentObject=cube)
         if 7 in choices:
-            self.createCubeFractal(centerX+SL/2,centerY+SL/2,centerZ+SL/2,decay*maxSideLength,maxLeaves,depth-1)
-            
+            self.createCubeFractal(centerX+SL/2,centerY+SL/2,centerZ+SL/2,decay*maxSideLength,maxLeaves,depth-1,parentObject=cube)
+        return np.arange(firstObject,self.objectCount)
         
             
+    def createProceduralRandomFractal(self,startX,startY,startZ,minTraverseDistance,maxTraverseDistance,maxLeaves,depth,decay=0.5,seed=None):
+        ##Like createRandomFractal, but stores only a seed and the parameters: branches are generated when they come
+        ##into view and always come out the same for the same seed. Returns an id for deleteProceduralFractal. Unlike
+        ##createRandomFractal, decay applies at every level
+        if seed is None:
+            seed = random.getrandbits(64)
+        return self.addProceduralFractal(RandomFractal(seed,[startX,startY,startZ,minTraverseDistance,maxTraverseDistance,depth],maxLeaves,decay))
+
+    def createProceduralCubeFractal(self,centerX,centerY,centerZ,maxSideLength,maxLeaves,depth,decay=0.5,seed=None):
+        ##Like createCubeFractal, generated when in view. Unlike createCubeFractal, decay applies at every level
+        if seed is None:
+            seed = random.getrandbits(64)
+        return self.addProceduralFractal(CubeFractal(seed,[centerX,centerY,centerZ,maxSideLength,depth],maxLeaves,decay,self.CUBECORNERS,self.CUBEEDGES))
+
+    def addProceduralFractal(self,fractal):
+        self.proceduralFractals.append(fractal)
+        self.sceneVersion += 1
+        self.markDirty(fractal.bounds(fractal.root[None,:]))
+        return len(self.proceduralFractals)-1
+
+    def deleteProceduralFractal(self,fractalId):
+        fractal = self.proceduralFractals[fractalId]
+        if fractal is None: #Already deleted
+            return
+        self.proceduralFractals[fractalId] = None #Ids stay valid; its cached chunks age out of the cache
+        self.sceneVersion += 1
+        self.markDirty(fractal.bounds(fractal.root[None,:]))
+
+    def markDirty(self,bounds=None):
+        ##Redraws the window area covered by the world space boxes bounds (kx6) on the next frame, or the whole window
+        ##if bounds is None. The create and delete methods call this themselves; call it with no bounds after changing
+        ##how the scene is drawn, such as the rasterizer or lodPixels
+        if bounds is None:
+            self.drawnCamera = None
+            self.dirtyBounds = []
+        elif self.drawnCamera is not None: #Nothing to track until a frame is on the window
+            self.dirtyBounds.append(np.asarray(bounds,dtype='float64').reshape(-1,6))
+
+    def markVerticesDirty(self,vertexIndexes):
+        ##Redraws the window area around the vertices at vertexIndexes on the next frame
+        if self.drawnCamera is None or np.size(vertexIndexes) == 0:
+            return
+        xyz = self.points[np.asarray(vertexIndexes).ravel(),:3].astype('float64')
+        self.markDirty(np.concatenate([xyz.min(axis=0),xyz.max(axis=0)]))
+
     def comparePoints(self,p1,p2):
         if (p1.size != p2.size):
             return False
@@ -155,7 +394,71 @@ class Environment:
                 return False
         return True
 
+    def enableStats(self,callback=None,overlay=False,history=120):
+        ##Starts timing every frame stage and counting culled, clipped and drawn primitives. callback, if given,
+        ##is called with the FrameStats at the end of each frame; overlay draws the statistics onto the window
+        self.stats = FrameStats(history)
+        if callback is not None:
+            self.stats.callbacks.append(callback)
+        self.statsOverlay = overlay
+        return self.stats
+
+    def disableStats(self):
+        self.stats = None
+        self.statsOverlay = False
+
+    def enableParallel(self,numWorkers=None):
+        ##Renders with a pool of numWorkers processes (one per core by default) sharing the geometry through shared memory
+        self.disableParallel()
+        self.parallelRenderer = ParallelRenderer(numWorkers)
+
+    def disableParallel(self):
+        if self.parallelRenderer is not None:
+            self.parallelRenderer.close()
+            self.parallelRenderer = None
+
     def draw(self):
+        ##Renders and presents one frame. While the camera holds still, a frame with nothing created or deleted since
+        ##the last one is skipped, and otherwise only the window rectangles around the changed geometry are redrawn
+        stats = self.stats
+        overlay = stats is not None and self.statsOverlay
+        rects = None #Window rectangles to redraw, None for the whole window
+        if self.drawnCamera is not None and np.array_equal(self.camera,self.drawnCamera):
+            rects = self.dirtyRects()
+        self.dirtyBounds = []
+        if rects is not None and self.overlayRect is not None:
+            rects.append(self.overlayRect) #Restores the geometry under the previous overlay
+        self.overlayRect = None
+        if rects is None:
+            self.render(self.windowSurface)
+            self.drawnCamera = self.camera.copy()
+        elif rects:
+            self.renderRects(self.windowSurface,rects)
+        elif stats is not None:
+            stats.count('idleFrames',1)
+        if overlay:
+            self.overlayRect = stats.drawOverlay(self.windowSurface)
+            stats.mark('overlay')
+            if rects is not None:
+                rects.append(self.overlayRect)
+        if rects is None:
+            pygame.display.update()
+        elif rects:
+            pygame.display.update(rects)
+        if stats is not None:
+            stats.mark('present')
+
+    def tick(self,seconds):
+        ##Handles pending input and moves the camera by seconds of held key motion
+        self.handleEvents()
+        if self.stats is not None:
+            self.stats.mark('events')
+        self.updateCamera(seconds)
+        if self.stats is not None:
+            self.stats.mark('camera')
+            self.stats.count('ticks',1)
+
+    def handleEvents(self):
         #Handle key events
         '''
         j: move left
@@ -177,140 +480,477 @@ class Environment:
                 pygame.quit()
                 sys.exit()
             if event.type == KEYDOWN:
-                if event.key == ord('j'):
-                    self.isTranslatingX = -1
-                if event.key == ord('l'):
-                    self.isTranslatingX = 1
-                if event.key == ord('i'):
-                    self.isTranslatingY = 1
-                if event.key == ord('k'):
-                    self.isTranslatingY = -1
-                if event.key == ord('u'):
-                    self.isTranslatingZ = 1
-                if event.key == ord('o'):
-                    self.isTranslatingZ = -1
-                    
-                if event.key == ord('a'):
-                    self.isRotatingY = -1
-                if event.key == ord('d'):
-                    self.isRotatingY = 1
-                if event.key == ord('w'):
-                    self.isRotatingX = 1
-                if event.key == ord('s'):
-                    self.isRotatingX = -1
-                if event.key == ord('q'):
-                    self.isRotatingZ = -1
-                if event.key == ord('e'):
-                    self.isRotatingZ = 1
-
+                self.pressKey(event.key)
             if event.type == KEYUP:
-                if event.key == ord('j') or event.key == ord('l'):
-                    self.isTranslatingX = 0
-                if event.key == ord('i') or event.key == ord('k'):
-                    self.isTranslatingY = 0
-                if event.key == ord('u') or event.key == ord('o'):
-                    self.isTranslatingZ = 0
-
-                if event.key == ord('a') or event.key == ord('d'):
-                    self.isRotatingY = 0
-                if event.key == ord('w') or event.key == ord('s'):
-                    self.isRotatingX = 0
-                if event.key == ord('q') or event.key == ord('e'):
-                    self.isRotatingZ = 0
+                self.releaseKey(event.key)
+            if event.type == VIDEOEXPOSE: #The window was uncovered and its contents may be lost
+                self.markDirty()
 
-        if self.isTranslatingX == -1:
-            self.translate(1)
-        elif self.isTranslatingX == 1:
-            self.translate(2)
-        if self.isTranslatingY == 1:
-            self.translate(3)
-        elif self.isTranslatingY == -1:
-            self.translate(4)
-        if self.isTranslatingZ == 1:
-            self.translate(5)
-        elif self.isTranslatingZ == -1:
-            self.translate(6)
+    def pressKey(self,key):
+        if key == ord('j'):
+            self.isTranslatingX = -1
+        if key == ord('l'):
+            self.isTranslatingX = 1
+        if key == ord('i'):
+            self.isTranslatingY = 1
+        if key == ord('k'):
+            self.isTranslatingY = -1
+        if key == ord('u'):
+            self.isTranslatingZ = 1
+        if key == ord('o'):
+            self.isTranslatingZ = -1
 
-        if self.isRotatingY == -1:
-            self.rotate(1)
-        elif self.isRotatingY == 1:
-            self.rotate(2)
-        if self.isRotatingX == 1:
-            self.rotate(3)
-        elif self.isRotatingX == -1:
-            self.rotate(4)
-        if self.isRotatingZ == -1:
-            self.rotate(6)
-        elif self.isRotatingZ == 1:
-            self.rotate(5)
-
-        #Draw geometry onto screen
-        self.windowSurface.fill((241,241,241))
-        for pointIndex in range(self.points.shape[0]):
-            if pointIndex in self.rawPointsReference:
-                if self.points[pointIndex,2] >= self.w: #Only draw point if it is in front of viewer
-                    center = self.points[pointIndex]/self.points[pointIndex,2]*self.w ##Performs projection onto view plane
-                    adjustedCenter = (int(center[0]+self.WINDOWWIDTH/2),int(center[1]+self.WINDOWHEIGHT/2))
-                    pygame.draw.circle(self.windowSurface,(168,0,0),adjustedCenter,3)
-            if pointIndex in self.linePointsReference:
-                if self.points[pointIndex,2] >= self.w and self.points[pointIndex+1,2] >= self.w: #If both points in front of viewer
-                    pos1 = self.points[pointIndex]/self.points[pointIndex,2]*self.w ##Performs projection onto view plane
-                    pos2 = self.points[pointIndex+1]/self.points[pointIndex+1,2]*self.w ##Performs projection onto view plane
-                    adjustedPos1 = (int(pos1[0]+self.WINDOWWIDTH/2),int(pos1[1]+self.WINDOWHEIGHT/2))
-                    adjustedPos2 = (int(pos2[0]+self.WINDOWWIDTH/2),int(pos2[1]+self.WINDOWHEIGHT/2))
-                    pygame.draw.line(self.windowSurface,(168,0,0),adjustedPos1,adjustedPos2,1)
-                elif self.points[pointIndex,2] >= self.w: #If first point in front of viewer
-                    slope = np.array([self.points[pointIndex,0]-self.points[pointIndex+1,0],self.points[pointIndex,1]-self.points[pointIndex+1,1],self.points[pointIndex,2]-self.points[pointIndex+1,2]])
-                    slopeNorm = math.pow(math.pow(slope[0],2)+math.pow(slope[1],2)+math.pow(slope[2],2),0.5)
-                    slope *= (self.points[pointIndex,2]-self.w)/slopeNorm #Normalize Slope
-                    slope = np.append(slope,1)
-                    
-                    pos1 = self.points[pointIndex]/self.points[pointIndex,2]*self.w ##Performs projection onto view plane
-                    pos2 = self.points[pointIndex]-slope
-
-                    adjustedPos1 = (int(pos1[0]+self.WINDOWWIDTH/2),int(pos1[1]+self.WINDOWHEIGHT/2))
-                    adjustedPos2 = (int(pos2[0]+self.WINDOWWIDTH/2),int(pos2[1]+self.WINDOWHEIGHT/2))
-
-                    pygame.draw.line(self.windowSurface,(168,0,0),adjustedPos1,adjustedPos2,1)
-                elif self.points[pointIndex+1,2] >= self.w: #If second point in front of viewer
-                    slope = np.array([self.points[pointIndex+1,0]-self.points[pointIndex,0],self.points[pointIndex+1,1]-self.points[pointIndex,1],self.points[pointIndex+1,2]-self.points[pointIndex,2]])
-                    slopeNorm = math.pow(math.pow(slope[0],2)+math.pow(slope[1],2)+math.pow(slope[2],2),0.5)
-                    slope *= (self.points[pointIndex+1,2]-self.w)/slopeNorm #Normalize Slope
-                    slope = np.append(slope,1)
-                    
-                    pos2 = self.points[pointIndex+1]/self.points[pointIndex+1,2]*self.w ##Performs projection onto view plane
-                    pos1 = self.points[pointIndex+1]-slope
-
-                    adjustedPos1 = (int(pos1[0]+self.WINDOWWIDTH/2),int(pos1[1]+self.WINDOWHEIGHT/2))
-                    adjustedPos2 = (int(pos2[0]+self.WINDOWWIDTH/2),int(pos2[1]+self.WINDOWHEIGHT/2))
-
-                    pygame.draw.line(self.windowSurface,(168,0,0),adjustedPos1,adjustedPos2,1)
-        pygame.display.update()
-        self.mainClock.tick(8000)
+        if key == ord('a'):
+            self.isRotatingY = -1
+        if key == ord('d'):
+            self.isRotatingY = 1
+        if key == ord('w'):
+            self.isRotatingX = 1
+        if key == ord('s'):
+            self.isRotatingX = -1
+        if key == ord('q'):
+            self.isRotatingZ = -1
+        if key == ord('e'):
+            self.isRotatingZ = 1
 
-    def translate(self,direction):
+    def releaseKey(self,key):
+        if key == ord('j') or key == ord('l'):
+            self.isTranslatingX = 0
+        if key == ord('i') or key == ord('k'):
+            self.isTranslatingY = 0
+        if key == ord('u') or key == ord('o'):
+            self.isTranslatingZ = 0
+
+        if key == ord('a') or key == ord('d'):
+            self.isRotatingY = 0
+        if key == ord('w') or key == ord('s'):
+            self.isRotatingX = 0
+        if key == ord('q') or key == ord('e'):
+            self.isRotatingZ = 0
+
+    def render(self,surface):
+        #Draw geometry onto surface
+        if self.parallelRenderer is not None and self.points.size:
+            self.parallelRenderer.render(self,surface)
+            if any(fractal is not None for fractal in self.proceduralFractals): #Procedural geometry is not in the shared buffers
+                RASTERIZERS[self.rasterizer](surface,self.LINECOLOR,*self.projectProcedural())
+            return
+        surface.fill(self.BACKGROUNDCOLOR)
+        if self.stats is not None:
+            self.stats.mark('clear')
+        pointCoords,lineStarts,lineEnds = self.project()
+        RASTERIZERS[self.rasterizer](surface,self.LINECOLOR,pointCoords,lineStarts,lineEnds)
+        if self.stats is not None:
+            self.stats.mark('raster')
+            self.stats.count('drawnPoints',len(pointCoords))
+            self.stats.count('drawnLines',len(lineStarts))
+
+    def dirtyRects(self):
+        ##Returns the window rectangles covering the dirty boxes, or None if a box reaches behind the view plane and
+        ##the whole window must be redrawn. Rectangles are padded by the point radius and rounding
+        if not self.dirtyBounds:
+            return []
+        bounds = np.vstack(self.dirtyBounds)
+        corners = np.stack([bounds[:,[x,y,z]] for x in (0,3) for y in (1,4) for z in (2,5)],axis=1) #kx8x3
+        viewCorners = np.dot(corners,np.transpose(self.camera[:3,:3]))+self.camera[:3,3]
+        inFront = viewCorners[:,:,2] >= self.w
+        if np.any(inFront.any(axis=1) & ~inFront.all(axis=1)):
+            return None
+        viewCorners = viewCorners[inFront.all(axis=1)] #Boxes wholly behind the viewer were never drawn
+        screen = viewCorners[:,:,:2]/viewCorners[:,:,2:3]*self.w+np.array([self.WINDOWWIDTH/2,self.WINDOWHEIGHT/2])
+        low = np.maximum(np.floor(screen.min(axis=1))-POINTRADIUS-2,0).astype('int64')
+        high = np.minimum(np.ceil(screen.max(axis=1))+POINTRADIUS+2,[self.WINDOWWIDTH,self.WINDOWHEIGHT]).astype('int64')
+        onScreen = np.all(high > low,axis=1)
+        rects = [pygame.Rect(x0,y0,x1-x0,y1-y0) for (x0,y0),(x1,y1) in zip(low[onScreen].tolist(),high[onScreen].tolist())]
+        if len(rects) > self.MAXDIRTYRECTS:
+            rects = [rects[0].unionall(rects[1:])]
+        return rects
+
+    def renderRects(self,surface,rects):
+        ##Redraws only the rectangles rects of surface. The objects reaching into them are drawn whole onto a scratch
+        ##surface and the rectangles copied back, so lines crossing a rectangle's edge get the same pixels as in a
+        ##full redraw
+        stats = self.stats
+        if self.scratchSurface is None or self.scratchSurface.get_size() != surface.get_size():
+            self.scratchSurface = surface.copy()
+        for rect in rects:
+            self.scratchSurface.fill(self.BACKGROUNDCOLOR,rect)
+        if stats is not None:
+            stats.mark('clear')
+        pointCoords,lineStarts,lineEnds = self.project(rects[0].unionall(rects[1:]))
+        RASTERIZERS[self.rasterizer](self.scratchSurface,self.LINECOLOR,pointCoords,lineStarts,lineEnds)
+        for rect in rects:
+            surface.blit(self.scratchSurface,rect,rect)
+        if stats is not None:
+            stats.mark('raster')
+            stats.count('drawnPoints',len(pointCoords))
+            stats.count('drawnLines',len(lineStarts))
+            stats.count('dirtyRects',len(rects))
+
+    def renderFrames(self,cameraPath=None,filePattern=None,keepFrames=True):
+        ##Renders into an offscreen surface without opening a window or reading events. cameraPath is a list whose
+        ##entries are either a 4x4 view matrix or a string of the movement keys held for that frame (e.g. 'ua' moves
+        ##forward while rotating left); None renders the current camera once. If filePattern is given (e.g.
+        ##'frames/%05d.png') each frame is also saved as an image. Returns the frames as HxWx3 arrays (an empty list
+        ##if keepFrames is False) and the rendering throughput in frames per second
+        if cameraPath is None:
+            cameraPath = [self.camera]
+        if len(cameraPath) == 0:
+            return [],0.0
+        surface = pygame.Surface((self.WINDOWWIDTH,self.WINDOWHEIGHT))
+        frames = []
+        startTime = time.perf_counter()
+        heldKeys = (self.isTranslatingX,self.isTranslatingY,self.isTranslatingZ,self.isRotatingX,self.isRotatingY,self.isRotatingZ)
+        try:
+            for frameNumber,pose in enumerate(cameraPath):
+                if self.stats is not None:
+                    self.stats.startFrame()
+                if isinstance(pose,str):
+                    for key in 'jlikuoadwsqe':
+                        self.releaseKey(ord(key))
+                    for key in pose:
+                        self.pressKey(ord(key))
+                    self.updateCamera()
+                else:
+                    self.camera = np.array(pose,dtype='float64')
+                if self.stats is not None:
+                    self.stats.mark('camera')
+                self.render(surface)
+                if self.stats is not None and self.statsOverlay:
+                    self.stats.drawOverlay(surface)
+                    self.stats.mark('overlay')
+                if filePattern is not None:
+                    pygame.image.save(surface,filePattern % frameNumber)
+                if keepFrames:
+                    frames.append(np.transpose(pygame.surfarray.array3d(surface),(1,0,2)))
+                if self.stats is not None:
+                    self.stats.mark('export')
+                    self.stats.endFrame()
+        finally: #Key strings only hold their keys for their own frame, not for later interactive use
+            self.isTranslatingX,self.isTranslatingY,self.isTranslatingZ,self.isRotatingX,self.isRotatingY,self.isRotatingZ = heldKeys
+        elapsed = time.perf_counter()-startTime
+        return frames,len(cameraPath)/elapsed if elapsed > 0 else float('inf')
+
+    def buildSpatialIndex(self):
+        ##Computes every object's bounding box over its live lines and points, groups line and point indexes by
+        ##object and builds the hierarchy
+        xyz = self.points[:,:3].astype('float64',copy=False) #Matching dtypes keep ufunc.at on its fast path
+        vertexObjects = self.vertexObjectBuffer.view()
+        lineObjects = vertexObjects[self.linePointsReference[:,1]]
+        pointObjects = vertexObjects[self.rawPointsReference]
+        lineAlive = self.lineAliveBuffer.view()
+        pointAlive = self.pointAliveBuffer.view()
+        liveLines = self.linePointsReference[lineAlive]
+        usedVertices = np.concatenate([liveLines[:,0],liveLines[:,1],self.rawPointsReference[pointAlive]]) #A line may start at a vertex of another object
+        usedObjects = np.concatenate([lineObjects[lineAlive],lineObjects[lineAlive],pointObjects[pointAlive]])
+        lower = np.full((self.objectCount,3),np.inf)
+        upper = np.full((self.objectCount,3),-np.inf)
+        np.minimum.at(lower,usedObjects,xyz[usedVertices])
+        np.maximum.at(upper,usedObjects,xyz[usedVertices])
+
+        objectIds = np.arange(self.objectCount)
+        self.lineOrder = np.argsort(lineObjects,kind='stable')
+        self.objectLineRanges = np.transpose([np.searchsorted(lineObjects[self.lineOrder],objectIds,'left'),np.searchsorted(lineObjects[self.lineOrder],objectIds,'right')])
+        self.pointOrder = np.argsort(pointObjects,kind='stable')
+        self.objectPointRanges = np.transpose([np.searchsorted(pointObjects[self.pointOrder],objectIds,'left'),np.searchsorted(pointObjects[self.pointOrder],objectIds,'right')])
+        isOwn = vertexObjects[usedVertices] == usedObjects
+        isMember = self.buildHierarchy(lower,upper,usedVertices[isOwn],usedObjects[isOwn])
+        self.indexedObjects = np.flatnonzero(np.isfinite(lower[:,0]) & ~isMember) #Objects whose lines and points were all deleted have no box
+        self.spatialIndex = SpatialIndex(np.hstack([lower,upper])[self.indexedObjects])
+
+    def buildHierarchy(self,lower,upper,ownVertices,ownObjects):
+        ##Groups the objects of fractal trees by parent and computes the bounding box of each object's whole branch,
+        ##bottom-up. Every branch also gets a representative vertex to draw it by once it is collapsed: the first of
+        ##its own vertices still used by a live line or point (ownVertices, of objects ownObjects), or else one of a
+        ##descendant's. Returns which objects belong to a tree; these are culled by walking their tree instead of the
+        ##spatial index
+        parents = self.objectParentBuffer.view()
+        objectIds = np.arange(self.objectCount)
+        children = np.flatnonzero(parents >= 0)
+        self.childOrder = children[np.argsort(parents[children],kind='stable')]
+        sortedParents = parents[self.childOrder]
+        self.childRanges = np.transpose([np.searchsorted(sortedParents,objectIds,'left'),np.searchsorted(sortedParents,objectIds,'right')])
+        isMember = parents >= 0
+        isMember[parents[children]] = True
+        roots = np.flatnonzero(isMember & (parents < 0))
+
+        self.objectBounds = np.hstack([lower,upper])
+        subtreeBounds = self.objectBounds.copy()
+        representatives = np.full(self.objectCount,len(self.vertexBuffer))
+        np.minimum.at(representatives,ownObjects,ownVertices)
+        representatives[representatives == len(self.vertexBuffer)] = -1
+        levels = []
+        level = roots
+        while level.size:
+            levels.append(level)
+            level = self.childOrder[expandRanges(self.childRanges[level,0],self.childRanges[level,1])]
+        for level in reversed(levels[1:]): #Children before their parents
+            np.minimum.at(subtreeBounds[:,:3],parents[level],subtreeBounds[level,:3])
+            np.maximum.at(subtreeBounds[:,3:],parents[level],subtreeBounds[level,3:])
+            orphans = level[(representatives[parents[level]] < 0) & (representatives[level] >= 0)] #Branches whose own object was deleted are drawn by a live descendant
+            representatives[parents[orphans]] = representatives[orphans]
+        self.hierarchyRoots = roots[np.isfinite(subtreeBounds[roots,0])]
+        self.subtreeBounds = subtreeBounds
+        self.objectRepresentatives = representatives
+        return isMember
+
+    def traverseHierarchy(self,planes):
+        ##Walks the fractal trees top-down, dropping branches outside the view frustum. Returns the objects inside it
+        ##that are drawn in full, and the branches projecting smaller than lodPixels, which are not opened further
+        drawn = []
+        collapsed = []
+        frontier = self.hierarchyRoots
+        while frontier.size:
+            bounds = self.subtreeBounds[frontier]
+            keep = np.isfinite(bounds[:,0]) #Branches left without geometry by deletes
+            keep[keep] = ~outsidePlanes(planes,bounds[keep])
+            frontier = frontier[keep]
+            bounds = bounds[keep]
+            small = self.smallBranches(bounds)
+            collapsed.append(frontier[small])
+            opened = frontier[~small]
+            drawn.append(opened)
+            frontier = self.childOrder[expandRanges(self.childRanges[opened,0],self.childRanges[opened,1])]
+        drawn = np.concatenate(drawn) if drawn else np.zeros(0,dtype='int64')
+        collapsed = np.concatenate(collapsed) if collapsed else np.zeros(0,dtype='int64')
+        ownBounds = self.objectBounds[drawn]
+        inside = np.isfinite(ownBounds[:,0])
+        inside[inside] = ~outsidePlanes(planes,ownBounds[inside])
+        return drawn[inside],collapsed
+
+    def saveScene(self,path):
+        ##Writes the geometry, with its object grouping and spatial index, to a binary scene file.
+        ##Deleted rows are compacted away first so the file only holds live geometry
+        if self.deadLines or self.deadPoints:
+            self.compact()
+        if self.spatialIndex is None:
+            self.buildSpatialIndex()
+        index = self.spatialIndex
+        writeArrays(path,{
+            'vertices':self.points,
+            'vertexObjects':self.vertexObjectBuffer.view(),
+            'objectParents':self.objectParentBuffer.view(),
+            'points':self.rawPointsReference,
+            'lines':self.linePointsReference,
+            'lineOrder':self.lineOrder,
+            'objectLineRanges':self.objectLineRanges,
+            'pointOrder':self.pointOrder,
+            'objectPointRanges':self.objectPointRanges,
+            'indexedObjects':self.indexedObjects,
+            'objectBounds':self.objectBounds,
+            'childOrder':self.childOrder,
+            'childRanges':self.childRanges,
+            'hierarchyRoots':self.hierarchyRoots,
+            'subtreeBounds':self.subtreeBounds,
+            'objectRepresentatives':self.objectRepresentatives,
+            'indexBounds':index.bounds,
+            'nodeOrder':index.order,
+            'nodeBounds':index.nodeBounds,
+            'nodeRanges':index.nodeRanges,
+            'nodeChildren':index.nodeChildren,
+        },{'objectCount':int(self.objectCount),'proceduralFractals':[None if fractal is None else fractal.parameters() for fractal in self.proceduralFractals]})
+
+    def loadScene(self,path):
+        ##Replaces the scene with one written by saveScene. The arrays are memory mapped rather than read, so even a
+        ##huge file opens at once and only the pages a frame touches are read from disk. Creating geometry afterwards
+        ##copies a buffer into memory the first time it grows
+        arrays,info = readArrays(path)
+        self.vertexBuffer = GeometryBuffer(arrays['vertices'].shape[1],data=arrays['vertices']) #Keeps the precision the scene was saved with
+        self.vertexObjectBuffer = GeometryBuffer(None,data=arrays['vertexObjects'])
+        self.objectParentBuffer = GeometryBuffer(None,data=arrays['objectParents'])
+        self.pointBuffer = GeometryBuffer(None,data=arrays['points'])
+        self.lineBuffer = GeometryBuffer(2,data=arrays['lines'])
+        self.pointAliveBuffer = GeometryBuffer(None,data=np.ones(len(self.pointBuffer),dtype='bool'))
+        self.lineAliveBuffer = GeometryBuffer(None,data=np.ones(len(self.lineBuffer),dtype='bool'))
+        self.deadPoints = 0
+        self.deadLines = 0
+        self.pointKeys = None
+        self.lineKeys = None
+        self.indexedPoints = 0
+        self.indexedLines = 0
+        self.objectCount = info['objectCount']
+        self.proceduralFractals = []
+        for parameters in info['proceduralFractals']:
+            if parameters is None:
+                self.proceduralFractals.append(None)
+                continue
+            kind = parameters.pop('kind')
+            if kind == 'cube':
+                parameters.update(corners=self.CUBECORNERS,edges=self.CUBEEDGES)
+            self.proceduralFractals.append(PROCEDURALKINDS[kind](**parameters))
+        self.chunkCache.clear()
+        self.lineOrder = arrays['lineOrder']
+        self.objectLineRanges = arrays['objectLineRanges']
+        self.pointOrder = arrays['pointOrder']
+        self.objectPointRanges = arrays['objectPointRanges']
+        self.indexedObjects = arrays['indexedObjects']
+        self.objectBounds = arrays['objectBounds']
+        self.childOrder = arrays['childOrder']
+        self.childRanges = arrays['childRanges']
+        self.hierarchyRoots = arrays['hierarchyRoots']
+        self.subtreeBounds = arrays['subtreeBounds']
+        self.objectRepresentatives = arrays['objectRepresentatives']
+        self.spatialIndex = SpatialIndex(arrays['indexBounds'],(arrays['nodeOrder'],arrays['nodeBounds'],arrays['nodeRanges'],arrays['nodeChildren']))
+        self.sceneVersion += 1
+        self.markDirty()
+
+    def frustumPlanes(self,rect=None):
+        ##Returns the near plane and the four screen edge planes of the view frustum in world space, as 5x4 rows
+        ##(a,b,c,d) with a*x+b*y+c*z+d >= 0 inside. Screen edges are widened by a few pixels for point radius and rounding.
+        ##rect narrows the frustum to the part of the window inside a pygame.Rect
+        if rect is None:
+            rect = pygame.Rect(0,0,self.WINDOWWIDTH,self.WINDOWHEIGHT)
+        left = self.WINDOWWIDTH/2-rect.left+4 #Distances from the window center to each widened edge
+        right = rect.right-self.WINDOWWIDTH/2+4
+        top = self.WINDOWHEIGHT/2-rect.top+4
+        bottom = rect.bottom-self.WINDOWHEIGHT/2+4
+        viewPlanes = np.array([[0,0,1,-self.w],[self.w,0,left,0],[-self.w,0,right,0],[0,self.w,top,0],[0,-self.w,bottom,0]])
+        return np.dot(viewPlanes,self.camera) ##A view space plane n satisfies n.(Cp) = (nC).p for world point p
+
+    def smallBranches(self,bounds):
+        ##Returns which boxes (kx6) project smaller than lodPixels, judged by their bounding sphere
+        if self.lodPixels <= 0:
+            return np.zeros(bounds.shape[0],dtype='bool')
+        center = (bounds[:,:3]+bounds[:,3:])/2
+        radius = np.linalg.norm(bounds[:,3:]-bounds[:,:3],axis=1)/2
+        nearZ = np.dot(center,self.camera[2,:3])+self.camera[2,3]-radius #View depth of the box's nearest possible point
+        return (nearZ >= self.w) & (2*radius*self.w < self.lodPixels*nearZ) #Projected diameter below lodPixels
+
+    def expandProcedural(self,planes):
+        ##Gathers the geometry of the procedural fractals inside the view frustum, as vertices (kx3), lines (mx2) and
+        ##points indexing them. Each fractal is walked from its root one chunk at a time: chunks are taken from the
+        ##cache or expanded, branches outside the frustum are skipped, and branches smaller than lodPixels are drawn
+        ##as a point
+        stats = self.stats
+        vertices = []
+        lines = []
+        points = []
+        numVertices = 0
+        numChunks = 0
+        for fractalId,fractal in enumerate(self.proceduralFractals):
+            if fractal is None:
+                continue
+            paths = [()] #Child indexes leading from the root to each branch
+            params = fractal.root[None,:]
+            while paths:
+                bounds = fractal.bounds(params)
+                inside = ~outsidePlanes(planes,bounds)
+                small = inside & self.smallBranches(bounds)
+                collapsed = fractal.position(params[small])
+                vertices.append(collapsed)
+                points.append(numVertices+np.arange(len(collapsed)))
+                numVertices += len(collapsed)
+                childPaths = []
+                childParams = []
+                for branch in np.flatnonzero(inside & ~small).tolist():
+                    key = (fractalId,)+paths[branch]
+                    chunk = self.chunkCache.get(key)
+                    if chunk is None:
+                        chunk = fractal.expand(params[branch],paths[branch])
+                        self.chunkCache.put(key,chunk)
+                    vertices.append(chunk.vertices)
+                    lines.append(chunk.lines+numVertices)
+                    points.append(chunk.points+numVertices)
+                    numVertices += len(chunk.vertices)
+                    numChunks += 1
+                    childPaths.extend(paths[branch]+(child,) for child in range(len(chunk.childParams)))
+                    childParams.append(chunk.childParams)
+                paths = childPaths
+                params = np.vstack(childParams) if childParams else None
+        if stats is not None:
+            stats.count('proceduralChunks',numChunks)
+            stats.count('chunkCacheBytes',self.chunkCache.nbytes)
+        return (np.vstack(vertices) if vertices else np.zeros((0,3)),np.vstack(lines) if lines else np.zeros((0,2),dtype='int64'),
+                np.concatenate(points) if points else np.zeros(0,dtype='int64'))
+
+    def projectProcedural(self,planes=None):
+        ##Projects the procedural fractal geometry inside planes (the view frustum by default), returning screen
+        ##coordinates like project
+        if planes is None:
+            planes = self.frustumPlanes()
+        vertices,lines,pointIndexes = self.expandProcedural(planes)
+        viewPoints = np.dot(vertices,np.transpose(self.camera[:,:3]))+self.camera[:,3]
+        pointCoords,lineStarts,lineEnds,numClipped = projectView(viewPoints,lines,pointIndexes,self.w,self.WINDOWWIDTH,self.WINDOWHEIGHT)
+        if self.stats is not None:
+            self.stats.mark('procedural')
+            self.stats.count('clippedLines',numClipped)
+        return pointCoords,lineStarts,lineEnds
+
+    def cullGeometry(self,planes=None):
+        ##Returns the lines (mx2 vertex indexes) and points (k vertex indexes) of every object inside planes, the view
+        ##frustum by default
+        stats = self.stats
+        if self.spatialIndex is None:
+            self.buildSpatialIndex()
+            if stats is not None:
+                stats.mark('index')
+        if planes is None:
+            planes = self.frustumPlanes()
+        visible = self.indexedObjects[self.spatialIndex.query(planes)]
+        drawnBranches,collapsedBranches = self.traverseHierarchy(planes)
+        visible = np.sort(np.concatenate([visible,drawnBranches]))
+        lineRows = self.lineOrder[expandRanges(self.objectLineRanges[visible,0],self.objectLineRanges[visible,1])]
+        pointRows = self.pointOrder[expandRanges(self.objectPointRanges[visible,0],self.objectPointRanges[visible,1])]
+        lines = self.linePointsReference[lineRows[self.lineAliveBuffer.view()[lineRows]]] #Skip deleted lines and points
+        pointIndexes = self.rawPointsReference[pointRows[self.pointAliveBuffer.view()[pointRows]]]
+        collapsedBranches = collapsedBranches[self.objectRepresentatives[collapsedBranches] >= 0] #Branches with nothing left to draw
+        pointIndexes = np.concatenate([pointIndexes,self.objectRepresentatives[collapsedBranches].astype(pointIndexes.dtype)]) #Each collapsed branch is drawn as a point
+        if stats is not None:
+            stats.mark('cull')
+            numObjects = np.count_nonzero(np.isfinite(self.objectBounds[:,0])) #Indexed objects and fractal branch members
+            stats.count('objects',numObjects)
+            stats.count('culledObjects',numObjects-len(visible))
+            stats.count('culledLines',len(self.lineBuffer)-self.deadLines-len(lines))
+            stats.count('collapsedBranches',len(collapsedBranches))
+        return lines,pointIndexes
+
+    def project(self,rect=None):
+        ##Projects the points and lines of every object inside the view frustum, returning integer screen coordinates
+        ##as (points kx2, line starts mx2, line ends mx2). Each distinct visible vertex is transformed and projected once,
+        ##and points and lines gather their projected vertices by index. rect limits this to objects reaching into
+        ##that part of the window
+        stats = self.stats
+        planes = self.frustumPlanes(rect)
+        empty = np.zeros((0,2),dtype='int64')
+        pointCoords,lineStarts,lineEnds = empty,empty,empty
+        if self.points.size:
+            lines,pointIndexes = self.cullGeometry(planes)
+            viewPoints,lines,pointIndexes = transformVisible(self.points,lines,pointIndexes,self.camera)
+            if stats is not None:
+                stats.mark('transform')
+            pointCoords,lineStarts,lineEnds,numClipped = projectView(viewPoints,lines,pointIndexes,self.w,self.WINDOWWIDTH,self.WINDOWHEIGHT)
+            if stats is not None:
+                stats.mark('project')
+                stats.count('clippedLines',numClipped)
+                stats.count('linesBehind',len(lines)-len(lineStarts))
+        if any(fractal is not None for fractal in self.proceduralFractals):
+            procedural = self.projectProcedural(planes)
+            pointCoords,lineStarts,lineEnds = [np.vstack(pair) for pair in zip((pointCoords,lineStarts,lineEnds),procedural)]
+        return pointCoords,lineStarts,lineEnds
+
+    def translationMatrix(self,direction,seconds=None):
+        ##Moves one step, or seconds of held key motion if seconds is given
         translateBy = 10*self.speedScalar
+        if seconds is not None:
+            translateBy *= seconds*self.STEPSPERSECOND
         if direction == 1: ##Pressed left, move everything 10 to the right
             T = np.array([[1,0,0,translateBy],[0,1,0,0],[0,0,1,0],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
         if direction == 2: ##Pressed right, move everything 10 to the left
             T = np.array([[1,0,0,-translateBy],[0,1,0,0],[0,0,1,0],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
         if direction == 3: ##Pressed up, move everything 10 down
             T = np.array([[1,0,0,0],[0,1,0,translateBy],[0,0,1,0],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
         if direction == 4: ##Pressed down, move everything 10 up
             T = np.array([[1,0,0,0],[0,1,0,-translateBy],[0,0,1,0],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
         if direction == 5: ##Pressed forward, move everything 10 towards you
             T = np.array([[1,0,0,0],[0,1,0,0],[0,0,1,-translateBy],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
         if direction == 6: ##Pressed backward, move everything 10 away from you
             T = np.array([[1,0,0,0],[0,1,0,0],[0,0,1,translateBy],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
-            
-    def rotate(self,direction):
+        return T
+
+    def rotationMatrix(self,direction,seconds=None):
         rotateBy = 3*self.speedScalar
+        if seconds is not None:
+            rotateBy *= seconds*self.STEPSPERSECOND
         degrees = rotateBy*math.pi/180
         posCos = math.cos(degrees)
         negCos = math.cos(-degrees)
@@ -318,34 +958,91 @@ class Environment:
         negSin = math.sin(-degrees)
         if direction == 1: ##Pressed left, rotate everything around y-axis to the right
             T = np.array([[negCos,0,-negSin,0],[0,1,0,0],[negSin,0,negCos,0],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
         if direction == 2: ##Pressed right, rotate everything around y-axis to the left
             T = np.array([[posCos,0,-posSin,0],[0,1,0,0],[posSin,0,posCos,0],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
         if direction == 3: ##Pressed forward, rotate everything around x-axis towards you
             T = np.array([[1,0,0,0],[0,negCos,negSin,0],[0,-negSin,negCos,0],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
         if direction == 4: ##Pressed backward, rotate everything around x-axis away from you
-           T = np.array([[1,0,0,0],[0,posCos,posSin,0],[0,-posSin,posCos,0],[0,0,0,1]])
-           self.points = np.transpose(np.dot(T,np.transpose(self.points)))
+            T = np.array([[1,0,0,0],[0,posCos,posSin,0],[0,-posSin,posCos,0],[0,0,0,1]])
         if direction == 5: ##Pressed CCW, rotate everything around z-axis CW
             T = np.array([[negCos,negSin,0,0],[-negSin,negCos,0,0],[0,0,1,0],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
         if direction == 6: ##Pressed CW, rotate everything around z-axis CCW
             T = np.array([[posCos,posSin,0,0],[-posSin,posCos,0,0],[0,0,1,0],[0,0,0,1]])
-            self.points = np.transpose(np.dot(T,np.transpose(self.points)))
-            
+        return T
+
+    def translate(self,direction):
+        self.camera = np.dot(self.translationMatrix(direction),self.camera)
+
+    def rotate(self,direction):
+        self.camera = np.dot(self.rotationMatrix(direction),self.camera)
+
+    def updateCamera(self,seconds=None):
+        ##Combines the motion of every held key into a single matrix and applies it to the camera once. Moves one
+        ##step per key, or seconds of motion at STEPSPERSECOND steps a second if seconds is given
+        T = np.identity(4)
+        if self.isTranslatingX == -1:
+            T = np.dot(self.translationMatrix(1,seconds),T)
+        elif self.isTranslatingX == 1:
+            T = np.dot(self.translationMatrix(2,seconds),T)
+        if self.isTranslatingY == 1:
+            T = np.dot(self.translationMatrix(3,seconds),T)
+        elif self.isTranslatingY == -1:
+            T = np.dot(self.translationMatrix(4,seconds),T)
+        if self.isTranslatingZ == 1:
+            T = np.dot(self.translationMatrix(5,seconds),T)
+        elif self.isTranslatingZ == -1:
+            T = np.dot(self.translationMatrix(6,seconds),T)
 
-    def launch(self):
+        if self.isRotatingY == -1:
+            T = np.dot(self.rotationMatrix(1,seconds),T)
+        elif self.isRotatingY == 1:
+            T = np.dot(self.rotationMatrix(2,seconds),T)
+        if self.isRotatingX == 1:
+            T = np.dot(self.rotationMatrix(3,seconds),T)
+        elif self.isRotatingX == -1:
+            T = np.dot(self.rotationMatrix(4,seconds),T)
+        if self.isRotatingZ == -1:
+            T = np.dot(self.rotationMatrix(6,seconds),T)
+        elif self.isRotatingZ == 1:
+            T = np.dot(self.rotationMatrix(5,seconds),T)
+        self.camera = np.dot(T,self.camera)
+
+    def launch(self,tickRate=60,targetFPS=60):
+        ##Input and camera motion advance in fixed ticks of 1/tickRate seconds, as many as the elapsed time calls for,
+        ##so the camera moves at the same speed however fast frames are drawn. Frames are drawn at most targetFPS
+        ##times a second (0 for as often as possible), sleeping in between rather than spinning. When a frame takes
+        ##too long the frames it overran are skipped instead of delaying the ticks, and after a stall longer than
+        ##MAXCATCHUPTICKS ticks the rest of the elapsed time is dropped. With stats enabled each frame also counts the
+        ##ticks run, ticks dropped and frames skipped since the previous one
         pygame.init()
-        self.mainClock = pygame.time.Clock()
         self.windowSurface = pygame.display.set_mode((self.WINDOWWIDTH, self.WINDOWHEIGHT), 0, 32)
         pygame.display.set_caption('Math 312 Final Project')
+        tickSeconds = 1/tickRate
+        frameSeconds = 1/targetFPS if targetFPS > 0 else 0
+        nextTick = nextFrame = time.perf_counter()
         while True:
-            self.draw()
-                
-
-            
-
-
-            
+            stats = self.stats
+            if stats is not None:
+                if stats.frameStart is None:
+                    stats.startFrame()
+                stats.mark('wait')
+            now = time.perf_counter()
+            ticks = 0
+            while now >= nextTick and ticks < self.MAXCATCHUPTICKS:
+                self.tick(tickSeconds)
+                nextTick += tickSeconds
+                ticks += 1
+            if now >= nextTick: #Too far behind to catch up
+                if stats is not None:
+                    stats.count('droppedTicks',(now-nextTick)//tickSeconds+1)
+                nextTick = now+tickSeconds
+            if now >= nextFrame:
+                self.draw()
+                late = time.perf_counter()-nextFrame
+                skipped = int(late//frameSeconds) if frameSeconds else 0 #Frame times that passed while drawing
+                nextFrame += (skipped+1)*frameSeconds
+                if stats is not None:
+                    stats.count('skippedFrames',skipped)
+                    stats.endFrame()
+                    stats.startFrame()
+            time.sleep(max(min(nextTick,nextFrame)-time.perf_counter(),0))
@@ -0,0 +1,108 @@
+"""
+Name:        FrameStats.py
+Author:      Robert Zhang - Written at University of Pennsylvania
+Contact:     robertzh@wharton.upenn.edu
+Description: Per-frame stage timers, primitive counts and rolling frame rate statistics, with an optional on-screen overlay
+"""
+
+import numpy as np
+import pygame, time
+from collections import deque
+
+class FrameStats:
+
+    HISTOGRAMBINS = [0,4,8,16,33,50,100,float('inf')] #Frame time histogram bucket edges in milliseconds
+
+    def __init__(self,history=120):
+        self.frameTimes = deque(maxlen=history) #Seconds of work in each recent frame
+        self.frameIntervals = deque(maxlen=history) #Seconds between the starts of consecutive recent frames
+        self.cpuIntervals = deque(maxlen=history) #Process CPU seconds used between the starts of consecutive recent frames
+        self.stageTimes = {} #Seconds spent in each stage of the current frame, in the order the stages ran
+        self.counts = {} #Primitive counts of the current frame
+        self.callbacks = [] #Called with this object at the end of every frame
+        self.frameNumber = 0
+        self.frameStart = None
+        self.cpuStart = None
+        self.lastMark = time.perf_counter() #Lets stages be marked before the first startFrame, as when render is called directly
+        self.font = None
+
+    def startFrame(self):
+        now = time.perf_counter()
+        cpuNow = time.process_time()
+        if self.frameStart is not None:
+            self.frameIntervals.append(now-self.frameStart)
+            self.cpuIntervals.append(cpuNow-self.cpuStart)
+        self.frameStart = now
+        self.cpuStart = cpuNow
+        self.lastMark = now
+        self.stageTimes = {}
+        self.counts = {}
+
+    def mark(self,stage):
+        ##Charges the time since the previous mark to stage
+        now = time.perf_counter()
+        self.stageTimes[stage] = self.stageTimes.get(stage,0)+now-self.lastMark
+        self.lastMark = now
+
+    def count(self,name,value):
+        self.counts[name] = self.counts.get(name,0)+int(value)
+
+    def endFrame(self):
+        self.frameTimes.append(time.perf_counter()-self.frameStart)
+        self.frameNumber += 1
+        for callback in self.callbacks:
+            callback(self)
+
+    def framesPerSecond(self):
+        if not self.frameIntervals:
+            return 0.0
+        return len(self.frameIntervals)/sum(self.frameIntervals)
+
+    def cpuPercent(self):
+        ##Share of one core used by this process over the recent frames, including time spent between frames
+        if not self.frameIntervals:
+            return 0.0
+        return 100*sum(self.cpuIntervals)/sum(self.frameIntervals)
+
+    def histogram(self):
+        ##Returns how many recent frames took between each pair of consecutive HISTOGRAMBINS edges
+        return np.histogram(np.array(self.frameTimes)*1000,self.HISTOGRAMBINS)[0]
+
+    def summary(self):
+        ##Returns the current frame's stages and counts and the rolling statistics as a plain dict
+        frameTimes = np.array(self.frameTimes)*1000
+        return {
+            'frame':self.frameNumber,
+            'framesPerSecond':self.framesPerSecond(),
+            'cpuPercent':self.cpuPercent(),
+            'frameMilliseconds':{
+                'mean':float(frameTimes.mean()) if frameTimes.size else 0.0,
+                'p95':float(np.percentile(frameTimes,95)) if frameTimes.size else 0.0,
+                'max':float(frameTimes.max()) if frameTimes.size else 0.0,
+            },
+            'histogram':dict(zip(['%g-%g ms' % (low,high) for low,high in zip(self.HISTOGRAMBINS[:-1],self.HISTOGRAMBINS[1:])],self.histogram().tolist())),
+            'stageMilliseconds':{stage:seconds*1000 for stage,seconds in self.stageTimes.items()},
+            'counts':dict(self.counts),
+        }
+
+    def drawOverlay(self,surface):
+        ##Writes the frame rate, stage times and counts in the top left corner of surface and returns the area covered
+        if self.font is None:
+            pygame.font.init()
+            self.font = pygame.font.Font(None,18)
+        frameTimes = np.array(self.frameTimes)*1000
+        lines = ['%.1f fps  %.1f ms mean  %.1f ms max  %.0f%% cpu' % (self.framesPerSecond(),frameTimes.mean() if frameTimes.size else 0,frameTimes.max() if frameTimes.size else 0,self.cpuPercent())]
+        stages = ['%s %.1f' % (stage,seconds*1000) for stage,seconds in self.stageTimes.items()]
+        counts = ['%s %d' % (name,value) for name,value in self.counts.items()]
+        for start in range(0,len(stages),5): #A few entries per line to fit the window
+            lines.append('  '.join(stages[start:start+5]))
+        for start in range(0,len(counts),3):
+            lines.append('  '.join(counts[start:start+3]))
+        lines.append('histogram ' + ' '.join(str(value) for value in self.histogram()))
+        rendered = [self.font.render(text,True,(40,40,40)) for text in lines]
+        backdrop = pygame.Surface((max(text.get_width() for text in rendered)+8,14*len(rendered)+6),pygame.SRCALPHA)
+        backdrop.fill((241,241,241,210)) #Keeps the text readable over the geometry
+        surface.blit(backdrop,(0,0))
+        for lineNumber,text in enumerate(rendered):
+            surface.blit(text,(4,4+14*lineNumber))
+        return backdrop.get_rect()
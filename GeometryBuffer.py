@@ -0,0 +1,57 @@
+"""
+Name:        GeometryBuffer.py
+Author:      Robert Zhang - Written at University of Pennsylvania
+Contact:     robertzh@wharton.upenn.edu
+Description: Growable array storage for vertices and indexes, doubling its capacity when full
+"""
+
+import numpy as np
+
+class GeometryBuffer:
+
+    def __init__(self,width=None,dtype='float64',capacity=64,data=None):
+        self.width = width #Number of columns per row, or None for a flat array
+        if data is not None: #Wraps existing rows such as a memory-mapped file, which are only copied once the buffer grows
+            self.size = data.shape[0]
+            self.data = data
+            return
+        self.size = 0 #Number of rows in use; rows past this are spare capacity
+        self.data = np.empty(self.rowShape(capacity),dtype=dtype)
+
+    def rowShape(self,numRows):
+        if self.width is None:
+            return (numRows,)
+        return (numRows,self.width)
+
+    def reserve(self,numRows):
+        ##Makes room for numRows more rows, doubling the capacity so appends are amortized O(1)
+        needed = self.size+numRows
+        if needed <= self.data.shape[0]:
+            return
+        capacity = max(self.data.shape[0],1)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty(self.rowShape(capacity),dtype=self.data.dtype)
+        grown[:self.size] = self.data[:self.size]
+        self.data = grown
+
+    def append(self,rows):
+        ##Copies rows onto the end of the buffer and returns the index of the first one
+        rows = np.asarray(rows,dtype=self.data.dtype).reshape(self.rowShape(-1))
+        self.reserve(rows.shape[0])
+        start = self.size
+        self.data[start:start+rows.shape[0]] = rows
+        self.size += rows.shape[0]
+        return start
+
+    def compress(self,keep):
+        ##Keeps only the rows where the boolean mask keep is True, packing them to the front in place
+        kept = self.data[:self.size][keep]
+        self.data[:kept.shape[0]] = kept
+        self.size = kept.shape[0]
+
+    def view(self):
+        return self.data[:self.size]
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,137 @@
+"""
+Name:        ParallelRenderer.py
+Author:      Robert Zhang - Written at University of Pennsylvania
+Contact:     robertzh@wharton.upenn.edu
+Description: Opt-in multi-process render path. The vertex buffer and the visible lines and points are published in
+             shared memory, a pool of worker processes each projects and rasterizes one chunk of them into its own
+             coverage layer, and the layers are composited into the final surface
+"""
+
+import numpy as np
+import pygame, os, multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from Projection import transformVisible, projectView
+from Rasterizer import RASTERIZERS
+
+class SharedArray:
+    ##A NumPy array backed by a named shared memory block that worker processes can attach to by name
+
+    def __init__(self,shape,dtype):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.memory = shared_memory.SharedMemory(create=True,size=max(int(np.prod(self.shape))*self.dtype.itemsize,1))
+        self.array = np.ndarray(self.shape,dtype=self.dtype,buffer=self.memory.buf)
+
+    def spec(self):
+        return (self.memory.name,self.shape,self.dtype.str)
+
+    def release(self):
+        self.array = None
+        self.memory.close()
+        self.memory.unlink()
+
+workerMemory = {} #Shared memory blocks this worker has attached to, by name
+workerSurface = None
+
+def attach(spec):
+    ##Returns the array described by spec, attaching to its shared memory block the first time it is seen
+    name,shape,dtype = spec
+    if name not in workerMemory:
+        try:
+            workerMemory[name] = shared_memory.SharedMemory(name=name,track=False)
+        except TypeError: #Before Python 3.13 attaching registers the block again, with the main process's tracker
+            workerMemory[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape,dtype=dtype,buffer=workerMemory[name].buf)
+
+def forget(names):
+    ##Detaches from blocks the main process has replaced
+    for name in list(workerMemory):
+        if name not in names:
+            workerMemory.pop(name).close()
+
+def renderChunk(task):
+    ##Worker side: projects lines[lineStart:lineEnd] and points[pointStart:pointEnd] and rasterizes them into layer
+    global workerSurface
+    verticesSpec,linesSpec,pointsSpec,layersSpec,layer,lineRange,pointRange,camera,w,width,height,rasterizer = task
+    forget([verticesSpec[0],linesSpec[0],pointsSpec[0],layersSpec[0]])
+    lines = attach(linesSpec)[lineRange[0]:lineRange[1]]
+    pointIndexes = attach(pointsSpec)[pointRange[0]:pointRange[1]]
+    viewPoints,lines,pointIndexes = transformVisible(attach(verticesSpec),lines,pointIndexes,camera)
+    pointCoords,lineStarts,lineEnds,numClipped = projectView(viewPoints,lines,pointIndexes,w,width,height)
+
+    if workerSurface is None or workerSurface.get_size() != (width,height):
+        workerSurface = pygame.Surface((width,height))
+    workerSurface.fill((0,0,0))
+    RASTERIZERS[rasterizer](workerSurface,(255,255,255),pointCoords,lineStarts,lineEnds)
+    attach(layersSpec)[layer] = pygame.surfarray.pixels2d(workerSurface) != 0
+    return len(pointCoords),len(lineStarts),numClipped
+
+class ParallelRenderer:
+
+    def __init__(self,numWorkers=None):
+        self.numWorkers = numWorkers or os.cpu_count() or 1
+        resource_tracker.ensure_running() #Workers share the main process's tracker, which cleans up each block once
+        self.pool = multiprocessing.Pool(self.numWorkers)
+        self.vertices = None #Shared copy of the vertex buffer
+        self.verticesVersion = None #Environment.sceneVersion the shared vertices were copied at
+        self.lines = None #Shared visible lines of the current frame, grown by doubling
+        self.points = None #Shared visible points of the current frame, grown by doubling
+        self.layers = None #One width x height coverage layer per worker
+
+    def share(self,current,shape,dtype):
+        ##Returns current if it can hold shape, otherwise a new shared array at least twice its size
+        if current is not None and current.shape[0] >= shape[0] and current.shape[1:] == tuple(shape[1:]) and current.dtype == dtype:
+            return current
+        if current is not None:
+            shape = (max(shape[0],2*current.shape[0]),)+tuple(shape[1:])
+            current.release()
+        return SharedArray(shape,dtype)
+
+    def render(self,environment,surface):
+        stats = environment.stats
+        if self.verticesVersion != environment.sceneVersion:
+            if self.vertices is not None:
+                self.vertices.release()
+            self.vertices = SharedArray(environment.points.shape,environment.points.dtype)
+            self.vertices.array[:] = environment.points
+            self.verticesVersion = environment.sceneVersion
+        width,height = surface.get_size()
+        if self.layers is None or self.layers.shape != (self.numWorkers,width,height):
+            if self.layers is not None:
+                self.layers.release()
+            self.layers = SharedArray((self.numWorkers,width,height),'bool')
+
+        lines,pointIndexes = environment.cullGeometry()
+        self.lines = self.share(self.lines,lines.shape,lines.dtype)
+        self.lines.array[:len(lines)] = lines
+        self.points = self.share(self.points,pointIndexes.shape,pointIndexes.dtype)
+        self.points.array[:len(pointIndexes)] = pointIndexes
+
+        lineSplits = np.linspace(0,len(lines),self.numWorkers+1).astype('int64')
+        pointSplits = np.linspace(0,len(pointIndexes),self.numWorkers+1).astype('int64')
+        tasks = [(self.vertices.spec(),self.lines.spec(),self.points.spec(),self.layers.spec(),layer,
+                  (lineSplits[layer],lineSplits[layer+1]),(pointSplits[layer],pointSplits[layer+1]),
+                  environment.camera,environment.w,width,height,environment.rasterizer) for layer in range(self.numWorkers)]
+        results = self.pool.map(renderChunk,tasks)
+        if stats is not None:
+            stats.mark('workers')
+
+        coverage = np.any(self.layers.array,axis=0)
+        pixels = pygame.surfarray.pixels3d(surface)
+        pixels[:] = environment.BACKGROUNDCOLOR
+        pixels[coverage] = environment.LINECOLOR
+        del pixels #Unlocks the surface
+        if stats is not None:
+            stats.mark('composite')
+            drawnPoints,drawnLines,numClipped = np.sum(results,axis=0)
+            stats.count('clippedLines',numClipped)
+            stats.count('drawnPoints',drawnPoints)
+            stats.count('drawnLines',drawnLines)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        for shared in (self.vertices,self.lines,self.points,self.layers):
+            if shared is not None:
+                shared.release()
+        self.vertices = self.lines = self.points = self.layers = None
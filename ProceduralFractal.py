@@ -0,0 +1,159 @@
+"""
+Name:        ProceduralFractal.py
+Author:      Robert Zhang - Written at University of Pennsylvania
+Contact:     robertzh@wharton.upenn.edu
+Description: Fractals stored as a seed and parameters instead of geometry. Each branch is expanded a few levels at a
+             time into a chunk, only when the camera needs it, from a random stream derived from the fractal's seed
+             and the branch's path, so a branch always expands to the same geometry. Chunks are kept in an LRU cache
+             bounded in bytes
+"""
+
+import numpy as np
+from collections import OrderedDict
+
+CHUNKLEVELS = 3 #Tree levels expanded together into one chunk
+CHILDSIGNS = np.array([[x,y,z] for x in (-1,1) for y in (-1,1) for z in (-1,1)]) #Directions of the 8 child cubes, in createCubeFractal's order
+
+class FractalChunk:
+    ##Geometry of a few levels of one branch: vertices (kx3), lines (mx2) and points indexing them, with the
+    ##unexpanded branches below given by one parameter row each
+
+    def __init__(self,vertices,lines,points,childParams):
+        self.vertices = vertices
+        self.lines = lines
+        self.points = points
+        self.childParams = childParams
+        self.nbytes = vertices.nbytes+lines.nbytes+points.nbytes+childParams.nbytes
+
+class ChunkCache:
+    ##Least recently used chunks are dropped once the cache holds more than maxBytes
+
+    def __init__(self,maxBytes=64*2**20):
+        self.maxBytes = maxBytes
+        self.chunks = OrderedDict()
+        self.nbytes = 0
+
+    def get(self,key):
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+        return chunk
+
+    def put(self,key,chunk):
+        self.chunks[key] = chunk
+        self.nbytes += chunk.nbytes
+        while self.nbytes > self.maxBytes and len(self.chunks) > 1:
+            self.nbytes -= self.chunks.popitem(last=False)[1].nbytes
+
+    def clear(self):
+        self.chunks.clear()
+        self.nbytes = 0
+
+class ProceduralFractal:
+
+    def __init__(self,seed,root,maxLeaves,decay):
+        self.seed = int(seed) #Plain Python numbers so parameters() can be written to a scene file header
+        self.root = np.array(root,dtype='float64') #Parameter row of the whole fractal
+        self.maxLeaves = int(maxLeaves)
+        self.decay = float(decay)
+
+    def parameters(self):
+        ##Plain values recreating this fractal, for scene files
+        return {'kind':self.KIND,'seed':self.seed,'root':self.root.tolist(),'maxLeaves':self.maxLeaves,'decay':self.decay}
+
+    def random(self,path):
+        ##Random stream of the branch reached by the child indexes in path
+        return np.random.default_rng(np.random.SeedSequence(self.seed,spawn_key=path))
+
+    def reach(self,maxSize,levels):
+        ##Farthest a branch can extend when its largest size is maxSize, shrinking by decay over levels levels
+        if self.decay == 1:
+            return maxSize*levels
+        return maxSize*(1-self.decay**levels)/(1-self.decay)
+
+class CubeFractal(ProceduralFractal):
+    ##createCubeFractal as parameter rows (center x,y,z, max side length, depth left)
+
+    KIND = 'cube'
+
+    def __init__(self,seed,root,maxLeaves,decay,corners,edges):
+        ProceduralFractal.__init__(self,seed,root,min(maxLeaves,8),decay)
+        self.corners = corners
+        self.edges = edges
+
+    def bounds(self,params):
+        ##Boxes holding every cube of each branch: a child's center is at most half its parent's side away
+        halfSize = self.reach(params[:,3],params[:,4]+1)/2
+        return np.hstack([params[:,:3]-halfSize[:,None],params[:,:3]+halfSize[:,None]])
+
+    def position(self,params):
+        return params[:,:3]
+
+    def expand(self,params,path):
+        rng = self.random(path)
+        centers = params[None,:3]
+        sides = params[3:4]
+        depths = params[4:5]
+        vertices = []
+        lines = []
+        numCubes = 0
+        for level in range(CHUNKLEVELS):
+            sideLengths = np.floor(rng.random(len(centers))*sides)
+            vertices.append((centers[:,None,:]+self.corners*sideLengths[:,None,None]/2).reshape(-1,3))
+            lines.append((self.edges+8*(numCubes+np.arange(len(centers)))[:,None,None]).reshape(-1,2))
+            numCubes += len(centers)
+            chosen = np.zeros((len(centers),8),dtype='bool')
+            chosen[np.arange(len(centers))[:,None],rng.integers(0,8,(len(centers),self.maxLeaves))] = True
+            chosen &= (depths > 0)[:,None]
+            parent,corner = np.nonzero(chosen)
+            centers = centers[parent]+CHILDSIGNS[corner]*sideLengths[parent,None]/2
+            sides = self.decay*sides[parent]
+            depths = depths[parent]-1
+        return FractalChunk(np.vstack(vertices),np.vstack(lines),np.zeros(0,dtype='int64'),
+                            np.column_stack([centers,sides,depths]))
+
+class RandomFractal(ProceduralFractal):
+    ##createRandomFractal as parameter rows (start x,y,z, min and max traverse distance, depth left). decay shrinks the
+    ##distances at every level, where createRandomFractal uses it only below the first level and 0.5 further down
+
+    KIND = 'random'
+
+    def bounds(self,params):
+        ##Boxes holding every branch: each level reaches at most its max traverse distance further, always towards +z
+        reach = self.reach(params[:,4],params[:,5])
+        return np.column_stack([params[:,0]-reach,params[:,1]-reach,params[:,2],params[:,0]+reach,params[:,1]+reach,params[:,2]+reach])
+
+    def position(self,params):
+        return params[:,:3]
+
+    def expand(self,params,path):
+        rng = self.random(path)
+        vertices = [params[None,:3]]
+        starts = np.array([0]) #Vertex of each branch's start point
+        minDistances = params[3:4].astype('int64')
+        maxDistances = params[4:5].astype('int64')
+        depths = params[5:6]
+        lines = []
+        points = []
+        numVertices = 1
+        for level in range(CHUNKLEVELS):
+            points.append(starts)
+            numLeaves = rng.integers(1,self.maxLeaves+1,len(starts))
+            parent = np.repeat(np.arange(len(starts)),numLeaves)
+            directions = np.column_stack([rng.integers(-50,51,len(parent)),rng.integers(-50,51,len(parent)),rng.integers(1,51,len(parent))])
+            distances = rng.integers(minDistances[parent],maxDistances[parent]+1)
+            leafEnds = np.vstack(vertices)[starts[parent]]+directions/np.linalg.norm(directions,axis=1)[:,None]*distances[:,None]
+            leafIndexes = numVertices+np.arange(len(parent))
+            vertices.append(leafEnds)
+            numVertices += len(parent)
+            lines.append(np.column_stack([starts[parent],leafIndexes]))
+            grow = depths[parent] > 1
+            starts = leafIndexes[grow]
+            minDistances = (self.decay*minDistances[parent][grow]).astype('int64') #Truncated like createRandomFractal's int()
+            maxDistances = (self.decay*maxDistances[parent][grow]).astype('int64')
+            depths = depths[parent][grow]-1
+        vertices = np.vstack(vertices)
+        return FractalChunk(vertices,np.vstack(lines),np.concatenate(points),
+                            np.column_stack([vertices[starts],minDistances,maxDistances,depths]))
+
+PROCEDURALKINDS = {'cube':CubeFractal,'random':RandomFractal}
@@ -0,0 +1,58 @@
+"""
+Name:        Projection.py
+Author:      Robert Zhang - Written at University of Pennsylvania
+Contact:     robertzh@wharton.upenn.edu
+Description: Moves indexed points and lines into the viewer's space and projects them onto the screen
+"""
+
+import numpy as np
+
+def transformVisible(vertices,lines,pointIndexes,camera):
+    ##Transforms only the vertices used by lines (mx2) and pointIndexes (k) with the 4x4 camera matrix, each
+    ##distinct vertex once. Returns the view space vertices and the lines and points renumbered against them
+    vertexIndexes,gathered = np.unique(np.concatenate([lines.ravel(),pointIndexes]),return_inverse=True)
+    visible = vertices[vertexIndexes].astype('float64',copy=False)
+    if visible.shape[1] == 3: #Implicit homogeneous w = 1 contributes the camera's translation column
+        viewPoints = np.dot(visible,np.transpose(camera[:,:3]))+camera[:,3]
+    else:
+        viewPoints = np.dot(visible,np.transpose(camera)) ##Moves the visible vertices into the viewer's space
+    return viewPoints,gathered[:lines.size].reshape(-1,2),gathered[lines.size:]
+
+def projectView(viewPoints,lines,pointIndexes,w,width,height):
+    ##Projects view space points and lines onto the view plane at distance w, returning integer screen coordinates
+    ##as (points kx2, line starts mx2, line ends mx2, number of lines clipped at the view plane). Each vertex is
+    ##projected once and points and lines gather their projected vertices by index
+    offset = np.array([width/2,height/2])
+    inFront = viewPoints[:,2] >= w
+    projected = np.zeros((viewPoints.shape[0],2))
+    projected[inFront] = viewPoints[inFront,:2]/viewPoints[inFront,2:3]*w ##Performs projection onto view plane
+
+    pointIndexes = pointIndexes[inFront[pointIndexes]] #Only draw points in front of viewer
+    pointCoords = (projected[pointIndexes]+offset).astype('int64')
+
+    startIndexes = lines[:,0]
+    endIndexes = lines[:,1]
+    startInFront = inFront[startIndexes]
+    endInFront = inFront[endIndexes]
+
+    both = startInFront & endInFront #Both points in front of viewer: use both projected ends
+    pos1 = projected[startIndexes[both]]
+    pos2 = projected[endIndexes[both]]
+
+    #Only one point in front of viewer: project that end, and end the line at the view space x,y of the point a
+    #distance of (z - w) back from it towards the hidden end, as the original per-line code did
+    onlyStart = startInFront & ~endInFront
+    onlyEnd = endInFront & ~startInFront
+    nearIndexes = np.concatenate([startIndexes[onlyStart],endIndexes[onlyEnd]])
+    farIndexes = np.concatenate([endIndexes[onlyStart],startIndexes[onlyEnd]])
+    near = viewPoints[nearIndexes,:3]
+    slope = near-viewPoints[farIndexes,:3]
+    slopeNorm = np.power(np.power(slope[:,0],2)+np.power(slope[:,1],2)+np.power(slope[:,2],2),0.5)
+    slope *= ((near[:,2]-w)/slopeNorm)[:,None] #Normalize Slope
+    nearPos = projected[nearIndexes]
+    farPos = near[:,:2]-slope[:,:2]
+    numFirst = np.count_nonzero(onlyStart)
+
+    lineStarts = np.vstack([pos1,nearPos[:numFirst],farPos[numFirst:]])
+    lineEnds = np.vstack([pos2,farPos[:numFirst],nearPos[numFirst:]])
+    return pointCoords,(lineStarts+offset).astype('int64'),(lineEnds+offset).astype('int64'),len(nearIndexes)
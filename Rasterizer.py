@@ -0,0 +1,92 @@
+"""
+Name:        Rasterizer.py
+Author:      Robert Zhang - Written at University of Pennsylvania
+Contact:     robertzh@wharton.upenn.edu
+Description: Backends drawing projected points and lines onto a surface. 'pygame' makes one draw call per primitive,
+             'polyline' joins lines that continue one another into single pygame.draw.lines calls, and 'numpy'
+             writes every pixel at once into the surface's pixel array
+"""
+
+import numpy as np
+import pygame
+
+POINTRADIUS = 3
+LONGLINE = 64 #Longest line in pixels rasterized with NumPy; past this one pygame call costs less than its pixels
+pointStamp = None #Pixel offsets covered by a point, taken from pygame.draw.circle so every backend draws the same dots
+
+def drawEach(surface,color,pointCoords,lineStarts,lineEnds):
+    for center in pointCoords.tolist():
+        pygame.draw.circle(surface,color,center,POINTRADIUS)
+    for pos1,pos2 in zip(lineStarts.tolist(),lineEnds.tolist()):
+        pygame.draw.line(surface,color,pos1,pos2,1)
+
+def drawPolylines(surface,color,pointCoords,lineStarts,lineEnds):
+    ##Draws each run of lines whose every line starts where the previous one ended (such as a createRandomPath
+    ##chain) with one pygame.draw.lines call
+    for center in pointCoords.tolist():
+        pygame.draw.circle(surface,color,center,POINTRADIUS)
+    if len(lineStarts) == 0:
+        return
+    breaks = np.flatnonzero(np.any(lineStarts[1:] != lineEnds[:-1],axis=1))+1
+    runStarts = np.concatenate([[0],breaks])
+    runEnds = np.concatenate([breaks,[len(lineStarts)]])
+    starts = lineStarts.tolist()
+    ends = lineEnds.tolist()
+    for start,end in zip(runStarts.tolist(),runEnds.tolist()):
+        if end-start == 1:
+            pygame.draw.line(surface,color,starts[start],ends[start],1)
+        else:
+            pygame.draw.lines(surface,color,False,[starts[start]]+ends[start:end],1)
+
+def linePixels(starts,ends):
+    ##Returns the pixels of every line from starts to ends (mx2 integers) in closed form, matching pygame's Bresenham
+    ##lines: each line steps once per pixel along its longer axis, and the shorter axis advances by
+    ##(k*minor+major-major//2-1)//major at step k
+    delta = ends-starts
+    sign = np.sign(delta)
+    delta = np.abs(delta)
+    xMajor = delta[:,0] > delta[:,1]
+    major = np.where(xMajor,delta[:,0],delta[:,1])
+    minor = np.where(xMajor,delta[:,1],delta[:,0])
+    firstPixels = np.cumsum(major+1)-(major+1)
+    line = np.repeat(np.arange(len(starts)),major+1) #Line of each pixel
+    step = np.arange(line.size)-firstPixels[line]
+    majorLength = major[line]
+    offset = (step*minor[line]+np.maximum(majorLength-majorLength//2-1,0))//np.maximum(majorLength,1)
+    lineIsXMajor = xMajor[line]
+    x = starts[line,0]+sign[line,0]*np.where(lineIsXMajor,step,offset)
+    y = starts[line,1]+sign[line,1]*np.where(lineIsXMajor,offset,step)
+    return np.stack([x,y],axis=1)
+
+def drawPixels(surface,color,pointCoords,lineStarts,lineEnds):
+    ##Rasterizes the points and the short lines inside the window all at once into a coverage mask and writes it into
+    ##the surface in one step. Long lines, and the few leaving the window which pygame clips, are cheaper as single
+    ##pygame calls. The result matches the 'pygame' backend pixel for pixel
+    global pointStamp
+    width,height = surface.get_size()
+    if pointStamp is None:
+        stampSurface = pygame.Surface((2*POINTRADIUS+3,2*POINTRADIUS+3))
+        pygame.draw.circle(stampSurface,(255,255,255),(POINTRADIUS+1,POINTRADIUS+1),POINTRADIUS)
+        pointStamp = np.argwhere(pygame.surfarray.array2d(stampSurface) != 0)-(POINTRADIUS+1)
+
+    size = np.array([width,height])
+    batched = np.all((lineStarts >= 0) & (lineStarts < size) & (lineEnds >= 0) & (lineEnds < size),axis=1)
+    batched &= np.abs(lineEnds-lineStarts).max(axis=1) <= LONGLINE
+    coverage = np.zeros((width,height),dtype='bool')
+    pixelCoords = linePixels(lineStarts[batched],lineEnds[batched])
+    coverage[pixelCoords[:,0],pixelCoords[:,1]] = True
+
+    #Points are stamped by shifting a mask of their centers once per pixel of the dot, however many points there are
+    centers = pointCoords[np.all((pointCoords >= -POINTRADIUS) & (pointCoords < size+POINTRADIUS),axis=1)]+POINTRADIUS
+    centerMask = np.zeros((width+2*POINTRADIUS,height+2*POINTRADIUS),dtype='bool')
+    centerMask[centers[:,0],centers[:,1]] = True
+    for dx,dy in pointStamp.tolist():
+        coverage |= centerMask[POINTRADIUS-dx:POINTRADIUS-dx+width,POINTRADIUS-dy:POINTRADIUS-dy+height]
+
+    pixels = pygame.surfarray.pixels2d(surface)
+    pixels[coverage] = surface.map_rgb(color)
+    del pixels #Unlocks the surface
+    for pos1,pos2 in zip(lineStarts[~batched].tolist(),lineEnds[~batched].tolist()):
+        pygame.draw.line(surface,color,pos1,pos2,1)
+
+RASTERIZERS = {'pygame':drawEach,'polyline':drawPolylines,'numpy':drawPixels}
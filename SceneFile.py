@@ -0,0 +1,63 @@
+"""
+Name:        SceneFile.py
+Author:      Robert Zhang - Written at University of Pennsylvania
+Contact:     robertzh@wharton.upenn.edu
+Description: Compact binary scene files. A small header (magic, version, and a JSON table giving the dtype, shape
+             and offset of every array) is followed by the raw arrays, each aligned to 64 bytes, so that loading
+             maps the arrays straight from disk with np.memmap and only pages in the parts that are touched
+"""
+
+import numpy as np
+import json, os, struct
+
+MAGIC = b'FWPGSCN\0'
+VERSION = 2
+ALIGNMENT = 64
+
+def align(offset):
+    return -(-offset//ALIGNMENT)*ALIGNMENT
+
+def writeArrays(path,arrays,info=None):
+    ##Writes the dict arrays of name to NumPy array, plus the JSON serializable dict info, to path. The file is
+    ##written beside path and then renamed over it, so arrays still memory mapped from an older path (as after
+    ##readArrays) stay valid while being saved, and a failed write leaves the old file whole
+    sections = {}
+    offset = 0
+    for name,array in arrays.items():
+        sections[name] = {'dtype':array.dtype.str,'shape':list(array.shape),'offset':offset}
+        offset = align(offset+array.nbytes)
+    header = json.dumps({'info':info or {},'sections':sections}).encode()
+    dataStart = align(len(MAGIC)+8+len(header)) #Offsets in the table are relative to the end of the header
+    tempPath = os.fspath(path)+'.tmp'
+    try:
+        with open(tempPath,'wb') as sceneFile:
+            sceneFile.write(MAGIC+struct.pack('<II',VERSION,len(header))+header)
+            for name,array in arrays.items():
+                sceneFile.seek(dataStart+sections[name]['offset'])
+                np.ascontiguousarray(array).tofile(sceneFile)
+            sceneFile.truncate(dataStart+offset)
+        os.replace(tempPath,path)
+    except BaseException:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+
+def readArrays(path):
+    ##Returns (arrays, info) from a file written by writeArrays. The arrays are copy-on-write memory maps:
+    ##nothing is read until used, and changes stay in memory without touching the file
+    with open(path,'rb') as sceneFile:
+        if sceneFile.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a scene file' % path)
+        version,headerLength = struct.unpack('<II',sceneFile.read(8))
+        if version != VERSION:
+            raise ValueError('%s has scene file version %d, expected %d' % (path,version,VERSION))
+        header = json.loads(sceneFile.read(headerLength).decode())
+    dataStart = align(len(MAGIC)+8+headerLength)
+    arrays = {}
+    for name,section in header['sections'].items():
+        shape = tuple(section['shape'])
+        if np.prod(shape) == 0:
+            arrays[name] = np.zeros(shape,dtype=section['dtype']) #Empty arrays cannot be memory mapped
+        else:
+            arrays[name] = np.memmap(path,dtype=section['dtype'],mode='c',offset=dataStart+section['offset'],shape=shape)
+    return arrays,header['info']
@@ -0,0 +1,97 @@
+"""
+Name:        SpatialIndex.py
+Author:      Robert Zhang - Written at University of Pennsylvania
+Contact:     robertzh@wharton.upenn.edu
+Description: Bounding volume hierarchy over object bounding boxes, used to cull objects outside the view frustum
+"""
+
+import numpy as np
+
+def expandRanges(starts,ends):
+    ##Concatenates arange(start,end) for every start,end pair without a Python loop
+    lengths = ends-starts
+    total = lengths.sum()
+    if total == 0:
+        return np.zeros(0,dtype='int64')
+    offsets = np.repeat(ends-lengths.cumsum(),lengths) #Shifts each run so it starts at its own start index
+    return np.arange(total,dtype='int64')+offsets
+
+def planeExtremes(planes,bounds):
+    ##Returns the smallest and largest value of each plane over each box, as two kxp arrays.
+    ##planes is px4 (a,b,c,d) with a*x+b*y+c*z+d >= 0 on the inside, bounds is kx6 (min x,y,z, max x,y,z)
+    normals = planes[:,:3]
+    lowCorner = np.where(normals > 0,bounds[:,None,:3],bounds[:,None,3:]) #Corner minimizing each plane
+    highCorner = np.where(normals > 0,bounds[:,None,3:],bounds[:,None,:3]) #Corner maximizing each plane
+    low = np.sum(lowCorner*normals,axis=2)+planes[:,3]
+    high = np.sum(highCorner*normals,axis=2)+planes[:,3]
+    return low,high
+
+def outsidePlanes(planes,bounds):
+    ##Returns which boxes (kx6) lie entirely outside one of the planes. planes[0] is the near plane, and boxes crossing
+    ##it are never outside: a line reaching behind the viewer is cut short at a point along it in view space, which
+    ##can land anywhere on screen whatever the other planes say
+    low,high = planeExtremes(planes,bounds)
+    return np.any(high < 0,axis=1) & ~((low[:,0] < 0) & (high[:,0] >= 0))
+
+class SpatialIndex:
+
+    LEAFSIZE = 8 #Most objects kept in one leaf node
+
+    def __init__(self,bounds,nodes=None):
+        ##Builds the hierarchy top-down, splitting each node at the median object center along its longest axis.
+        ##Every node covers a contiguous run order[lo:hi] of object ids, so a whole subtree can be accepted at once.
+        ##nodes reuses an already built hierarchy, as (order, nodeBounds, nodeRanges, nodeChildren) arrays
+        self.bounds = bounds #kx6 object bounding boxes
+        if nodes is not None:
+            self.order,self.nodeBounds,self.nodeRanges,self.nodeChildren = nodes
+            return
+        self.order = np.arange(bounds.shape[0])
+        centers = (bounds[:,:3]+bounds[:,3:])/2
+        nodeBounds = []
+        nodeRanges = []
+        nodeChildren = []
+        stack = [(0,bounds.shape[0],-1,0)] if bounds.shape[0] else [] #lo, hi, parent node, which child of the parent
+        while stack:
+            lo,hi,parent,side = stack.pop()
+            node = len(nodeRanges)
+            if parent >= 0:
+                nodeChildren[parent][side] = node
+            members = self.order[lo:hi]
+            nodeBounds.append(np.concatenate([bounds[members,:3].min(axis=0),bounds[members,3:].max(axis=0)]))
+            nodeRanges.append((lo,hi))
+            nodeChildren.append([-1,-1])
+            if hi-lo > self.LEAFSIZE:
+                memberCenters = centers[members]
+                axis = np.argmax(memberCenters.max(axis=0)-memberCenters.min(axis=0))
+                mid = (hi-lo)//2
+                self.order[lo:hi] = members[np.argpartition(memberCenters[:,axis],mid)]
+                stack.append((lo+mid,hi,node,1))
+                stack.append((lo,lo+mid,node,0))
+        self.nodeBounds = np.array(nodeBounds).reshape(-1,6)
+        self.nodeRanges = np.array(nodeRanges,dtype='int64').reshape(-1,2)
+        self.nodeChildren = np.array(nodeChildren,dtype='int64').reshape(-1,2)
+
+    def query(self,planes):
+        ##Returns the sorted ids of objects whose boxes are not outside the planes, as judged by outsidePlanes.
+        ##Walks the tree one level at a time: nodes fully inside every plane are accepted whole, nodes fully
+        ##outside any plane are dropped with their subtrees, and only straddling nodes are opened further
+        if self.bounds.shape[0] == 0:
+            return np.zeros(0,dtype='int64')
+        accepted = []
+        straddlingLeaves = []
+        frontier = np.array([0])
+        while frontier.size:
+            low,high = planeExtremes(planes,self.nodeBounds[frontier])
+            outside = np.any(high < 0,axis=1) & ~((low[:,0] < 0) & (high[:,0] >= 0)) #As in outsidePlanes
+            inside = np.all(low >= 0,axis=1)
+            isLeaf = self.nodeChildren[frontier,0] < 0
+            accepted.append(frontier[inside])
+            straddlingLeaves.append(frontier[~outside & ~inside & isLeaf])
+            frontier = self.nodeChildren[frontier[~outside & ~inside & ~isLeaf]].ravel()
+
+        accepted = np.concatenate(accepted)
+        visible = [self.order[expandRanges(self.nodeRanges[accepted,0],self.nodeRanges[accepted,1])]]
+        straddlingLeaves = np.concatenate(straddlingLeaves)
+        candidates = self.order[expandRanges(self.nodeRanges[straddlingLeaves,0],self.nodeRanges[straddlingLeaves,1])]
+        visible.append(candidates[~outsidePlanes(planes,self.bounds[candidates])]) #Test objects of straddling leaves one by one
+        return np.sort(np.concatenate(visible))
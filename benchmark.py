@@ -0,0 +1,268 @@
+"""
+Name:        benchmark.py
+Author:      Robert Zhang - Written at University of Pennsylvania
+Contact:     robertzh@wharton.upenn.edu
+Description: Reproducible headless benchmarks of scene construction, camera motion, projection and drawing.
+             Run "python benchmark.py" to time every seeded scene and write the results to benchmark.json, and
+             "python benchmark.py --compare old.json" to print how each timing changed against an earlier run
+"""
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER','dummy') #Never open a window
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT','1')
+
+import argparse, gc, json, platform, random, subprocess, tempfile, time
+import numpy as np
+import pygame
+from Environment import Environment
+
+SEED = 312
+SIZES = [1000,10000,100000,1000000] #Target vertex counts for the random point, line and cube scenes
+RANDOMFRACTALDEPTHS = [2,3,4,5,6]
+CUBEFRACTALDEPTHS = [3,4,5,6,7]
+
+def seeded():
+    random.seed(SEED)
+    np.random.seed(SEED)
+    return np.random.default_rng(SEED)
+
+def buildPoints(environment,numVertices):
+    rng = seeded()
+    environment.createPoints(rng.integers(-1000,1000,(numVertices,3)))
+
+def buildLines(environment,numVertices):
+    rng = seeded()
+    environment.createLines(rng.integers(-1000,1000,(numVertices//2,6)))
+
+def buildCubes(environment,numVertices):
+    rng = seeded()
+    environment.createCubes(rng.integers(-1000,1000,(numVertices//8,3)),rng.integers(30,200,numVertices//8))
+
+def buildCubesPerCall(environment,numVertices):
+    ##Same as main.py: one createCube call per cube
+    seeded()
+    for i in range(numVertices//8):
+        environment.createCube(random.randint(-1000,1000),random.randint(-1000,1000),random.randint(-1000,1000),random.randint(30,200))
+
+def buildRandomPaths(environment,numVertices):
+    ##Chains of 100 connected segments, as drawn by the polyline rasterizer
+    seeded()
+    for i in range(max(numVertices//101,1)):
+        environment.createRandomPath(random.randint(-1000,1000),random.randint(-1000,1000),random.randint(-1000,1000),5,40,100)
+
+def buildRandomFractal(environment,depth):
+    seeded()
+    for i in range(4):
+        environment.createRandomFractal(random.randint(-1000,1000),random.randint(-1000,1000),random.randint(-1000,1000),400,1000,5,depth)
+
+def buildCubeFractal(environment,depth):
+    seeded()
+    environment.createCubeFractal(random.randint(-1000,1000),random.randint(-1000,1000),random.randint(100,1000),200,3,depth)
+
+def buildProceduralRandomFractal(environment,depth):
+    seeded()
+    for i in range(4):
+        environment.createProceduralRandomFractal(random.randint(-1000,1000),random.randint(-1000,1000),random.randint(-1000,1000),400,1000,5,depth,seed=SEED+i)
+
+def buildProceduralCubeFractal(environment,depth):
+    seeded()
+    environment.createProceduralCubeFractal(random.randint(-1000,1000),random.randint(-1000,1000),random.randint(100,1000),200,3,depth,seed=SEED)
+
+def scenes(sizes,perCallLimit):
+    ##Yields (scene name, size parameter, builder) for every benchmarked scene
+    for size in sizes:
+        yield 'points',size,buildPoints
+        yield 'lines',size,buildLines
+        yield 'cubes',size,buildCubes
+        yield 'paths',size,buildRandomPaths
+        if size <= perCallLimit:
+            yield 'cubesPerCall',size,buildCubesPerCall
+    for depth in RANDOMFRACTALDEPTHS:
+        yield 'randomFractal',depth,buildRandomFractal
+        yield 'proceduralRandomFractal',depth,buildProceduralRandomFractal
+    for depth in CUBEFRACTALDEPTHS:
+        yield 'cubeFractal',depth,buildCubeFractal
+        yield 'proceduralCubeFractal',depth,buildProceduralCubeFractal
+
+def timeIt(function,repeats):
+    ##Returns the median wall time of repeats calls
+    times = []
+    for i in range(repeats):
+        startTime = time.perf_counter()
+        function()
+        times.append(time.perf_counter()-startTime)
+    return float(np.median(times))
+
+def geometryBytes(environment):
+    ##Bytes of vertex, index and object id storage in use
+    return sum(buffer.view().nbytes for buffer in (environment.vertexBuffer,environment.pointBuffer,environment.lineBuffer,environment.vertexObjectBuffer))
+
+def benchmarkScene(name,size,builder,repeats,precision='float64',rasterizer='pygame',lodPixels=0):
+    environment = Environment(speedScalar=5,precision=precision,rasterizer=rasterizer,lodPixels=lodPixels)
+    startTime = time.perf_counter()
+    builder(environment,size)
+    buildSeconds = time.perf_counter()-startTime
+
+    startTime = time.perf_counter()
+    environment.project() #First frame also builds the spatial index
+    firstFrameSeconds = time.perf_counter()-startTime
+
+    surface = pygame.Surface((environment.WINDOWWIDTH,environment.WINDOWHEIGHT))
+    camera = environment.camera
+    result = {
+        'scene':name,
+        'size':size,
+        'vertices':len(environment.vertexBuffer),
+        'lines':len(environment.lineBuffer),
+        'points':len(environment.pointBuffer),
+        'precision':precision,
+        'rasterizer':rasterizer,
+        'lodPixels':lodPixels,
+        'geometryBytes':geometryBytes(environment),
+        'buildSeconds':buildSeconds,
+        'firstFrameSeconds':firstFrameSeconds,
+        'translateSeconds':timeIt(lambda: [environment.translate(direction) for direction in range(1,7)],repeats)/6,
+        'rotateSeconds':timeIt(lambda: [environment.rotate(direction) for direction in range(1,7)],repeats)/6,
+    }
+    environment.camera = camera
+    result['projectSeconds'] = timeIt(environment.project,repeats)
+    result['drawSeconds'] = timeIt(lambda: environment.render(surface),repeats)
+    result['chunkCacheBytes'] = environment.chunkCache.nbytes
+    return result
+
+def benchmarkParallel(size,workerCounts,repeats):
+    ##Times the single process draw of the random line scene against the parallel render path with each worker count
+    environment = Environment(speedScalar=5)
+    buildLines(environment,size)
+    surface = pygame.Surface((environment.WINDOWWIDTH,environment.WINDOWHEIGHT))
+    environment.render(surface)
+    singleSeconds = timeIt(lambda: environment.render(surface),repeats)
+    results = []
+    for numWorkers in workerCounts:
+        environment.enableParallel(numWorkers)
+        environment.render(surface) #Starts the workers and publishes the vertices
+        drawSeconds = timeIt(lambda: environment.render(surface),repeats)
+        environment.disableParallel()
+        results.append({'scene':'linesParallel%d' % numWorkers,'size':size,'workers':numWorkers,'vertices':len(environment.vertexBuffer),
+                        'singleDrawSeconds':singleSeconds,'drawSeconds':drawSeconds,'speedup':singleSeconds/drawSeconds})
+    return results
+
+def residentBytes():
+    ##Resident memory of this process, or None where /proc is unavailable
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError,ValueError):
+        return None
+
+def benchmarkSceneFile(name,size,builder):
+    ##Times rebuilding a scene and drawing its first frame against loading it from a scene file and drawing its first
+    ##frame, with the resident memory each way leaves behind
+    surface = pygame.Surface((500,500))
+    gc.collect()
+    residentBefore = residentBytes()
+    environment = Environment(speedScalar=5)
+    startTime = time.perf_counter()
+    builder(environment,size)
+    environment.render(surface)
+    rebuildSeconds = time.perf_counter()-startTime
+    rebuildResident = residentBytes()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory,'scene.scn')
+        startTime = time.perf_counter()
+        environment.saveScene(path)
+        saveSeconds = time.perf_counter()-startTime
+        vertices = len(environment.vertexBuffer)
+        del environment
+        gc.collect()
+        residentLoad = residentBytes()
+        environment = Environment(speedScalar=5)
+        startTime = time.perf_counter()
+        environment.loadScene(path)
+        loadSeconds = time.perf_counter()-startTime
+        environment.render(surface)
+        loadFirstFrameSeconds = time.perf_counter()-startTime
+        loadResident = residentBytes()
+        fileBytes = os.path.getsize(path)
+        del environment
+    result = {'scene':name+'File','size':size,'vertices':vertices,'fileBytes':fileBytes,'rebuildSeconds':rebuildSeconds,
+              'saveSeconds':saveSeconds,'loadSeconds':loadSeconds,'loadFirstFrameSeconds':loadFirstFrameSeconds}
+    if residentBefore is not None:
+        result['rebuildResidentBytes'] = rebuildResident-residentBefore
+        result['loadResidentBytes'] = loadResident-residentLoad
+    return result
+
+def gitCommit():
+    try:
+        return subprocess.check_output(['git','rev-parse','HEAD'],cwd=os.path.dirname(os.path.abspath(__file__)),stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def settingsKey(row):
+    ##Scene, size and the render settings a row was measured with; rows written before a setting existed used its default
+    return (row['scene'],row['size'],row.get('precision','float64'),row.get('rasterizer','pygame'),row.get('lodPixels',0))
+
+def compare(oldPath,results):
+    ##Prints the ratio new/old of every timing found in both runs, only between rows measured with the same settings
+    with open(oldPath) as oldFile:
+        oldRows = json.load(oldFile)['results']
+    old = {settingsKey(row):row for row in oldRows}
+    oldScenes = {(row['scene'],row['size']) for row in oldRows}
+    for row in results:
+        previous = old.get(settingsKey(row))
+        if previous is None:
+            if (row['scene'],row['size']) in oldScenes:
+                print('%-23s %8s  not compared, measured with different precision, rasterizer or lod pixels' % (row['scene'],row['size']))
+            continue
+        ratios = ['%s %.2fx' % (key[:-7],row[key]/previous[key]) for key in row if key.endswith('Seconds') and previous.get(key)]
+        print('%-23s %8s  %s' % (row['scene'],row['size'],'  '.join(ratios)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless benchmarks of scene build, camera motion, projection and drawing')
+    parser.add_argument('--sizes',type=int,nargs='+',default=SIZES,help='vertex counts of the random point, line and cube scenes')
+    parser.add_argument('--repeats',type=int,default=5,help='timed repetitions per stage, the median is reported')
+    parser.add_argument('--per-call-limit',type=int,default=100000,help='largest size also built with one createCube call per cube')
+    parser.add_argument('--output',default='benchmark.json',help='file the results are written to')
+    parser.add_argument('--compare',help='earlier results file to compare against')
+    parser.add_argument('--precision',choices=['float64','float32'],default='float64',help='vertex storage precision of the benchmarked scenes')
+    parser.add_argument('--rasterizer',choices=['pygame','polyline','numpy'],default='pygame',help='backend drawing the benchmarked scenes')
+    parser.add_argument('--lod-pixels',type=float,default=0,help='collapse fractal branches smaller than this many pixels into points')
+    parser.add_argument('--scene-files',action='store_true',help='also time saving and loading every scene against rebuilding it')
+    parser.add_argument('--workers',type=int,nargs='*',default=[],help='also time the parallel render path of the line scenes with these worker counts')
+    args = parser.parse_args()
+
+    results = []
+    for name,size,builder in scenes(args.sizes,args.per_call_limit):
+        row = benchmarkScene(name,size,builder,args.repeats,args.precision,args.rasterizer,args.lod_pixels)
+        results.append(row)
+        print('%-23s %8s  %8d vertices  %6.1f MB  build %.4fs  project %.4fs  draw %.4fs' % (name,size,row['vertices'],row['geometryBytes']/1e6,row['buildSeconds'],row['projectSeconds'],row['drawSeconds']))
+    if args.scene_files:
+        for name,size,builder in scenes(args.sizes,args.per_call_limit):
+            row = benchmarkSceneFile(name,size,builder)
+            results.append(row)
+            print('%-23s %8s  %8d vertices  rebuild %.4fs  save %.4fs  load %.4fs  load and draw %.4fs' % (row['scene'],size,row['vertices'],row['rebuildSeconds'],row['saveSeconds'],row['loadSeconds'],row['loadFirstFrameSeconds']))
+    if args.workers:
+        for size in args.sizes:
+            for row in benchmarkParallel(size,args.workers,args.repeats):
+                results.append(row)
+                print('%-23s %8s  %8d vertices  draw %.4fs  single process %.4fs  speedup %.2fx' % (row['scene'],size,row['vertices'],row['drawSeconds'],row['singleDrawSeconds'],row['speedup']))
+
+    report = {
+        'commit':gitCommit(),
+        'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python':platform.python_version(),
+        'numpy':np.__version__,
+        'pygame':pygame.version.ver,
+        'machine':platform.platform(),
+        'cpus':os.cpu_count(),
+        'seed':SEED,
+        'repeats':args.repeats,
+        'results':results,
+    }
+    with open(args.output,'w') as outputFile:
+        json.dump(report,outputFile,indent=1)
+    if args.compare:
+        compare(args.compare,results)
+
+if __name__ == '__main__':
+    main()
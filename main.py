@@ -72,5 +72,11 @@ for i in range(100):
 ##randZ = random.randint(100,1000)
 ##environment.createCubeFractal(randX,randY,randZ,200,3,5)
 
+##'''Render a scripted camera path offscreen instead of opening a window, saving each frame as a png
+##   Render with "environment.renderFrames(list of held keys or 4x4 camera matrices, file name pattern)"
+##'''
+##frames,framesPerSecond = environment.renderFrames(['u']*60+['ua']*60,'frame%03d.png')
+##print(framesPerSecond,'frames per second')
+
 environment.launch()
 